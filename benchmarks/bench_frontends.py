@@ -0,0 +1,152 @@
+"""
+Headless benchmark of the two slideshow frontends.
+
+Generates a synthetic image corpus, runs shimo3.shimo_ok.main under SDL's
+dummy video driver and thegoodone.GrowingView under QT_QPA_PLATFORM=offscreen
+for a fixed number of slides, and saves FPS, slide-transition latency, peak
+RSS and CPU per slide as JSON so that commits can be compared.
+
+    python benchmarks/bench_frontends.py --frontend both --count 20 --size 4000x3000 --out bench.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from shimo3.metrics import load, percentile
+
+
+def generate_corpus(folder, count, size, fmt, seed=0):
+    """Writes `count` synthetic images of `size` in format `fmt` to folder"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+
+    rnd = random.Random(seed)
+    w, h = size
+    for i in range(count):
+        # alternate landscape and portrait like a real phone library
+        surface = pygame.Surface((w, h) if i % 2 == 0 else (h, w))
+        for _ in range(40):
+            color = [rnd.randrange(256) for _ in range(3)]
+            rect = (rnd.randrange(surface.get_width()), rnd.randrange(surface.get_height()),
+                    rnd.randrange(1, w // 2), rnd.randrange(1, h // 2))
+            surface.fill(color, rect)
+        pygame.image.save(surface, os.path.join(folder, f"bench{i}_{i}.{fmt}"))
+
+
+def run_child(frontend, workdir):
+    """Entry point of the measured process"""
+    os.chdir(workdir)
+    if frontend == "pygame":
+        from shimo3 import shimo_ok
+        shimo_ok.main("config.yaml")
+    else:
+        with open("config.yaml", "r") as f:
+            config = yaml.safe_load(f)
+        from PyQt5.QtWidgets import QApplication
+        from shimo3.channel import CommandChannel
+        from thegoodone import GrowingView
+
+        app = QApplication(sys.argv)
+        view = GrowingView(CommandChannel(), config)
+        view.resize(*config["window_size"])
+        view.show()
+        app.exec_()
+
+
+def run_frontend(frontend, corpus, workdir, slides, window):
+    stats_file = os.path.join(workdir, f"stats_{frontend}.json")
+    config = {"download_folder": corpus, "save_dir": corpus, "stats_file": stats_file,
+              "cache_folder": os.path.join(workdir, "cache"), "max_slides": slides,
+              "window_size": list(window), "duration": 0.5, "delay": 500}
+    with open(os.path.join(workdir, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f)
+
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", QT_QPA_PLATFORM="offscreen")
+    start = time.monotonic()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", frontend, workdir], env=env)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.monotonic() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    snapshot = load(stats_file) or {"histograms": {}, "counters": {}, "since": 0, "time": 0}
+    frames = snapshot["counters"].get("frames", 0)
+    transition = snapshot["histograms"].get("transition", {"count": 0, "total": 0, "max": 0, "buckets": []})
+    cpu = usage.ru_utime + usage.ru_stime
+    return {
+        "frontend": frontend,
+        "exit_code": proc.returncode,
+        "wall_s": round(wall, 3),
+        "fps": round(frames / max(1e-9, snapshot["time"] - snapshot["since"]), 2),
+        "frames": frames,
+        "frames_dropped": snapshot["counters"].get("frames_dropped", 0),
+        "transition_avg_ms": round(transition["total"] / transition["count"], 2) if transition["count"] else None,
+        "transition_p95_ms": percentile(transition, 95) if transition["count"] else None,
+        "transition_max_ms": transition["max"],
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "cpu_s": round(cpu, 3),
+        "cpu_per_slide_s": round(cpu / slides, 3),
+        "histograms": snapshot["histograms"],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of the slideshow frontends")
+    parser.add_argument("--frontend", choices=["pygame", "qt", "both"], default="both")
+    parser.add_argument("--count", type=int, default=20, help="number of synthetic images")
+    parser.add_argument("--size", default="4000x3000", help="image resolution WxH")
+    parser.add_argument("--format", default="jpg", choices=["jpg", "png", "bmp"])
+    parser.add_argument("--slides", type=int, default=10, help="slides shown per run")
+    parser.add_argument("--window", default="1920x1080", help="display resolution WxH")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    size = tuple(int(v) for v in args.size.split("x"))
+    window = tuple(int(v) for v in args.window.split("x"))
+    frontends = ["pygame", "qt"] if args.frontend == "both" else [args.frontend]
+
+    results = {"commit": git_commit(), "time": time.time(),
+               "corpus": {"count": args.count, "size": size, "format": args.format},
+               "slides": args.slides, "window": window, "runs": []}
+
+    with tempfile.TemporaryDirectory(prefix="shimo_bench_") as workdir:
+        corpus = os.path.join(workdir, "corpus")
+        os.makedirs(corpus)
+        print(f"Generating {args.count} images of {args.size} ({args.format})...")
+        generate_corpus(corpus, args.count, size, args.format)
+
+        for frontend in frontends:
+            print(f"Running {frontend} for {args.slides} slides...")
+            run = run_frontend(frontend, corpus, workdir, args.slides, window)
+            results["runs"].append(run)
+            print(f"  fps={run['fps']} transition_avg={run['transition_avg_ms']}ms "
+                  f"peak_rss={run['peak_rss_mb']}MB cpu/slide={run['cpu_per_slide_s']}s")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
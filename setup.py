@@ -13,6 +13,10 @@ setup(
         "pyyaml",
         "python-telegram-bot[job-queue]"
     ],
+    extras_require={
+        # reduced-size JPEG decoding and EXIF orientation in the pygame frontend
+        "fast": ["Pillow"],
+    },
     author="Danilo Tardioli",
     author_email="dantard@unizar.es",
     description="A Slideshow integrated with Telegram to display images received via bot.",
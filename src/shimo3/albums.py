@@ -0,0 +1,71 @@
+import asyncio
+
+# Telegram does not allow more photos in a media group
+MAX_PARTS = 10
+
+
+class AlbumAssembler:
+    """
+    Collects the photos of Telegram media groups, which arrive as separate
+    messages. A group is flushed when no new part arrived for `quiet`
+    seconds (the wait restarts with every part), as soon as it has
+    MAX_PARTS parts, and in any case `cap` seconds after its first part.
+    Parts arriving after the flush are assembled the same way and handed
+    over with the caption of the group they belong to.
+
+    on_flush(key, parts, caption, late) is a coroutine; caption is the first
+    caption seen in the group ("" if none) and late tells whether earlier
+    parts of the group were already flushed.
+    """
+
+    def __init__(self, on_flush, quiet=0.4, cap=3.0, linger=300):
+        self.on_flush = on_flush
+        self.quiet = quiet
+        self.cap = cap
+        self.linger = linger
+        # Key: group key, e.g. (chat_id, media_group_id)
+        # Value: dict with parts, caption, first arrival time and timer
+        self.groups = {}
+        # Groups already flushed, to merge late parts
+        # Key: group key
+        # Value: dict with caption, number of parts and flush time
+        self.flushed = {}
+
+    def add(self, key, part, caption=None):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        # forget old groups, their late parts would not come anymore
+        for old in [k for k, v in self.flushed.items() if now - v["time"] > self.linger]:
+            del self.flushed[old]
+
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {"parts": [], "caption": "", "first": now, "timer": None}
+        group["parts"].append(part)
+        if caption and not group["caption"]:
+            group["caption"] = caption
+        if group["timer"] is not None:
+            group["timer"].cancel()
+
+        earlier = self.flushed.get(key, {}).get("parts", 0)
+        if earlier + len(group["parts"]) >= MAX_PARTS:
+            self.flush(key)
+        else:
+            delay = min(self.quiet, group["first"] + self.cap - now)
+            group["timer"] = loop.call_later(max(0.0, delay), self.flush, key)
+
+    def flush(self, key):
+        group = self.groups.pop(key, None)
+        if group is None:
+            return
+        if group["timer"] is not None:
+            group["timer"].cancel()
+
+        previous = self.flushed.get(key)
+        late = previous is not None
+        caption = previous["caption"] if late and previous["caption"] else group["caption"]
+        self.flushed[key] = {"caption": caption,
+                             "parts": (previous["parts"] if late else 0) + len(group["parts"]),
+                             "time": asyncio.get_running_loop().time()}
+        asyncio.get_running_loop().create_task(self.on_flush(key, group["parts"], caption, late))
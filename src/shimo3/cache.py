@@ -0,0 +1,252 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+
+class ImageCache:
+    """
+    Persistent cache of images derived from the originals (e.g. resized to
+    the screen resolution). Entries are keyed by the hash of the source file
+    content plus the target resolution, so the originals are never touched,
+    a modified source gets a new entry and the old one simply ages out.
+    The total size on disk is kept under `budget` bytes by evicting the
+    least recently used entries.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, folder, budget=512 * 1024 * 1024, ext=".jpg"):
+        self.folder = folder
+        self.budget = budget
+        self.ext = ext
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.saved_at = 0
+
+        # Key: cache key
+        # Value: [size in bytes, last time used]
+        self.entries = {}
+        # Key: source path
+        # Value: [mtime_ns, size, content hash]
+        self.hashes = {}
+
+        os.makedirs(folder, exist_ok=True)
+
+        try:
+            with open(os.path.join(folder, self.MANIFEST), "r") as f:
+                manifest = json.load(f)
+        except Exception:
+            manifest = {}
+        self.hashes = manifest.get("hashes", {})
+        last_used = manifest.get("used", {})
+
+        # The folder is the source of truth, the manifest only remembers
+        # when each entry was last used.
+        for entry in os.scandir(folder):
+            if entry.name.endswith(".tmp" + self.ext):
+                # left behind by an interrupted store()
+                os.remove(entry.path)
+            elif entry.name.endswith(self.ext) and entry.is_file():
+                key = entry.name[:-len(self.ext)]
+                st = entry.stat()
+                self.entries[key] = [st.st_size, last_used.get(key, st.st_mtime)]
+
+    def source_hash(self, path):
+        """Content hash of path, only recomputed when the file changes"""
+        st = os.stat(path)
+        with self.lock:
+            known = self.hashes.get(path)
+        if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+            return known[2]
+
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+
+        with self.lock:
+            self.hashes[path] = [st.st_mtime_ns, st.st_size, digest]
+            self.dirty = True
+        return digest
+
+    def key(self, path, resolution):
+        w, h = resolution
+        return f"{self.source_hash(path)}_{w}x{h}"
+
+    def path(self, key):
+        return os.path.join(self.folder, key + self.ext)
+
+    def lookup(self, key):
+        """Returns the path of the cached file for key or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry[1] = time.time()
+            self.dirty = True
+        return self.path(key)
+
+    def store(self, key, writer):
+        """
+        Adds an entry: writer(tmp_path) must write the file, which is then
+        renamed into place so a half-written entry is never visible.
+        """
+        final = self.path(key)
+        tmp = os.path.join(self.folder, f"{key}.{threading.get_ident()}.tmp{self.ext}")
+        writer(tmp)
+        os.replace(tmp, final)
+
+        with self.lock:
+            self.entries[key] = [os.path.getsize(final), time.time()]
+            self.dirty = True
+            self._evict()
+        return final
+
+    def _evict(self):
+        total = sum(size for size, _ in self.entries.values())
+        if total <= self.budget:
+            return
+        for key, (size, _) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            del self.entries[key]
+            total -= size
+            if total <= self.budget:
+                break
+
+    def save(self, force=False):
+        """Writes the manifest, at most every 30 seconds unless forced"""
+        with self.lock:
+            if not self.dirty or (not force and time.time() - self.saved_at < 30):
+                return
+            manifest = {"hashes": dict(self.hashes),
+                        "used": {key: used for key, (_, used) in self.entries.items()}}
+            self.dirty = False
+            self.saved_at = time.time()
+
+        tmp = os.path.join(self.folder, self.MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(self.folder, self.MANIFEST))
+
+
+class RawCache(ImageCache):
+    """
+    ImageCache of decoded pixels in a raw layout, for images shown over and
+    over. Files are memory-mapped and their pixels used in place, so loading
+    an image costs no decode and no copy, only reading the pages drawn.
+
+    A file has a header (magic, pixel format such as "RGBX" or "RGBA",
+    number of levels), the width, height, pitch and offset of each level
+    (e.g. of a resolution pyramid) and then their pixels.
+    """
+
+    MAGIC = b"SHRW"
+    HEADER = struct.Struct("<4s4sI")
+    LEVEL = struct.Struct("<IIIQ")
+    # pixels start at multiples of this
+    ALIGN = 64
+
+    def __init__(self, folder, budget=1024 * 1024 * 1024):
+        super().__init__(folder, budget, ext=".raw")
+
+    def store_levels(self, key, fmt, levels):
+        """levels: list of ((width, height), pitch, pixels) in pixel format fmt"""
+        def write(tmp):
+            offset = self.HEADER.size + self.LEVEL.size * len(levels)
+            offsets = []
+            for _, pitch, pixels in levels:
+                offset = -(-offset // self.ALIGN) * self.ALIGN
+                offsets.append(offset)
+                offset += len(pixels)
+            with open(tmp, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, fmt.encode().ljust(4), len(levels)))
+                for ((w, h), pitch, _), offset in zip(levels, offsets):
+                    f.write(self.LEVEL.pack(w, h, pitch, offset))
+                for (_, _, pixels), offset in zip(levels, offsets):
+                    f.seek(offset)
+                    f.write(pixels)
+        return self.store(key, write)
+
+    def load_levels(self, key):
+        """
+        Returns (fmt, levels) with levels a list of ((width, height), pitch,
+        pixels), pixels being a memoryview of the mapped file, or None if key
+        is not cached. The mapping is private, writing to it never reaches
+        the file.
+        """
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            magic, fmt, count = self.HEADER.unpack_from(mapping, 0)
+            if magic != self.MAGIC:
+                return None
+            view = memoryview(mapping)
+            levels = []
+            for i in range(count):
+                w, h, pitch, offset = self.LEVEL.unpack_from(mapping, self.HEADER.size + i * self.LEVEL.size)
+                levels.append(((w, h), pitch, view[offset:offset + pitch * h]))
+        except (OSError, ValueError, struct.error) as e:
+            # evicted meanwhile or truncated
+            print(f"Raw cache entry {key} not usable: {e}")
+            return None
+        return fmt.decode().strip(), levels
+
+
+class MemoryCache:
+    """
+    In-memory LRU cache of prepared images (surfaces, pixmaps...) kept under
+    `budget` bytes, so that going back to a recent slide needs no decode.
+    The caller tells the size of each value when storing it.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        # Key: cache key
+        # Value: (value, size in bytes), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the value of key, None if it is not cached"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.used -= self.entries.pop(key)[1]
+        if size > self.budget:
+            return
+        self.entries[key] = (value, size)
+        self.used += size
+        while self.used > self.budget:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.used -= evicted
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return round(self.hits / total, 3) if total else 0.0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    caption TEXT NOT NULL DEFAULT '',
+    sender_id INTEGER,
+    sender_name TEXT,
+    chat_id INTEGER,
+    message_id INTEGER,
+    received_at REAL,
+    width INTEGER,
+    height INTEGER,
+    file_unique_id TEXT,
+    content_hash TEXT,
+    cache_key TEXT,
+    views INTEGER NOT NULL DEFAULT 0,
+    last_shown REAL
+);
+CREATE INDEX IF NOT EXISTS media_received_at ON media(received_at);
+CREATE INDEX IF NOT EXISTS media_views ON media(views);
+CREATE INDEX IF NOT EXISTS media_content_hash ON media(content_hash);
+CREATE INDEX IF NOT EXISTS media_file_unique_id ON media(file_unique_id);
+-- every addition, caption change and removal gets a new version, so that
+-- the display nodes can ask for what changed since the version they have
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS media_added AFTER INSERT ON media
+    BEGIN INSERT INTO changes (filename) VALUES (new.filename); END;
+CREATE TRIGGER IF NOT EXISTS media_caption AFTER UPDATE OF caption ON media
+    BEGIN INSERT INTO changes (filename) VALUES (new.filename); END;
+CREATE TRIGGER IF NOT EXISTS media_removed AFTER DELETE ON media
+    BEGIN INSERT INTO changes (filename) VALUES (old.filename); END;
+"""
+
+FIELDS = ("caption", "sender_id", "sender_name", "chat_id", "message_id", "received_at",
+          "width", "height", "file_unique_id", "content_hash", "cache_key")
+
+
+def legacy_caption(filename):
+    """Caption encoded in the filename by older versions ("caption_msgid.jpg")"""
+    if filename.startswith("unnamed"):
+        return ""
+    return filename.split("_")[0]
+
+
+def message_info(msg, caption=None):
+    """Catalog fields of a Telegram message, caption defaults to the message's own"""
+    return {"caption": caption if caption is not None else (msg.caption or ""),
+            "sender_id": msg.from_user.id,
+            "sender_name": msg.from_user.full_name,
+            "chat_id": msg.chat_id,
+            "message_id": msg.message_id,
+            "received_at": msg.date.timestamp()}
+
+
+class Catalog:
+    """
+    SQLite database with what is known about each image of the folder:
+    caption, sender, chat, reception time, size, cache key and how often it
+    was shown. Written by the bot on ingest and read by the displays, each
+    process with its own connection (WAL mode allows concurrent readers).
+    Images are identified by their filename inside the folder.
+    """
+
+    def __init__(self, folder, path=None):
+        self.folder = folder
+        self.path = path or os.path.join(folder, ".catalog.db")
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def add(self, filename, **info):
+        """Adds filename or updates the given fields if it is already there"""
+        info = {k: v for k, v in info.items() if k in FIELDS and v is not None}
+        # only the given fields are updated on an existing row
+        updates = ", ".join(f"{c}=excluded.{c}" for c in info)
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        info.setdefault("received_at", time.time())
+        columns = ["filename"] + list(info)
+        with self.lock, self.db:
+            self.db.execute(f"INSERT INTO media ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                            f"ON CONFLICT(filename) {conflict}",
+                            [filename] + list(info.values()))
+
+    def remove(self, filename):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM media WHERE filename=?", (filename,))
+
+    def sync(self, added, removed):
+        """
+        Keeps the catalog in line with the folder (FolderIndex events, as
+        filenames). Images copied by hand get their caption from the name.
+        """
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR IGNORE INTO media (filename, caption, received_at) VALUES (?, ?, ?)",
+                                [(f, legacy_caption(f), time.time()) for f in added])
+            self.db.executemany("DELETE FROM media WHERE filename=?", [(f,) for f in removed])
+
+    def sync_all(self, filenames):
+        """Full reconciliation with the list of files of the folder, done at start-up"""
+        filenames = set(filenames)
+        known = set(self.filenames())
+        self.sync(filenames - known, known - filenames)
+
+    def filenames(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT filename FROM media")]
+
+    def caption(self, filename):
+        with self.lock:
+            row = self.db.execute("SELECT caption FROM media WHERE filename=?", (filename,)).fetchone()
+        return row[0] if row else legacy_caption(filename)
+
+    def info(self, filename):
+        """All the fields of filename as a dict, None if unknown"""
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM media WHERE filename=?", (filename,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def version(self):
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(MAX(version), 0) FROM changes").fetchone()[0]
+
+    def changes(self, since=0):
+        """
+        Returns (version, changed, removed): the current version, the
+        (filename, caption) rows added or changed after version `since` and
+        the filenames removed after it. With since 0 (or a version this
+        catalog never had) changed lists everything and removed is None.
+        """
+        with self.lock:
+            version = self.db.execute("SELECT COALESCE(MAX(version), 0) FROM changes").fetchone()[0]
+            if since <= 0 or since > version:
+                return version, self.db.execute("SELECT filename, caption FROM media").fetchall(), None
+            changed = self.db.execute("SELECT filename, caption FROM media WHERE filename IN "
+                                      "(SELECT filename FROM changes WHERE version > ?)", (since,)).fetchall()
+            removed = [row[0] for row in self.db.execute(
+                "SELECT DISTINCT filename FROM changes WHERE version > ? "
+                "AND filename NOT IN (SELECT filename FROM media)", (since,))]
+            return version, changed, removed
+
+    def record_view(self, filename):
+        with self.lock, self.db:
+            self.db.execute("UPDATE media SET views=views+1, last_shown=? WHERE filename=?",
+                            (time.time(), filename))
+
+    def set_cache_key(self, filename, key):
+        with self.lock, self.db:
+            self.db.execute("UPDATE media SET cache_key=? WHERE filename=?", (key, filename))
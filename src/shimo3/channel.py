@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+from dataclasses import asdict, dataclass
+
+
+# --- Commands sent from the bot to the display ---
+
+@dataclass
+class SetMessage:
+    text: str
+
+
+@dataclass
+class ResetMessage:
+    pass
+
+
+@dataclass
+class Shuffle:
+    pass
+
+
+@dataclass
+class Next:
+    pass
+
+
+@dataclass
+class Previous:
+    pass
+
+
+@dataclass
+class NewImage:
+    # full path of an image just added to the folder, shown next
+    path: str
+
+
+COMMANDS = {cls.__name__: cls for cls in (SetMessage, ResetMessage, Shuffle, Next, Previous, NewImage)}
+
+
+def command_to_dict(command):
+    """JSON-friendly form of a command, to send it over the network"""
+    return {"type": type(command).__name__, **asdict(command)}
+
+
+def command_from_dict(data):
+    data = dict(data)
+    return COMMANDS[data.pop("type")](**data)
+
+
+def parse_command(text):
+    """Converts a bot command ("/m hello") to a command object, None if unknown"""
+    fields = text.split(" ")
+    command = fields[0]
+    if command == "/m":
+        return SetMessage(" ".join(fields[1:]))
+    elif command == "/reset":
+        return ResetMessage()
+    elif command == "/shuffle":
+        return Shuffle()
+    elif command == "/next":
+        return Next()
+    elif command == "/prev":
+        return Previous()
+    return None
+
+
+class CommandChannel:
+    """
+    One-way channel from the bot process to the display, built on a pipe.
+    The receiving end has a file descriptor that becomes readable when
+    commands are pending, so the display can sleep until something arrives
+    and then drain all of them at once instead of polling every frame.
+    """
+
+    def __init__(self):
+        self.reader, self.writer = multiprocessing.Pipe(duplex=False)
+        self.lock = multiprocessing.Lock()
+
+    def send(self, command):
+        with self.lock:
+            self.writer.send(command)
+
+    def fileno(self):
+        """Readable when there are pending commands (for QSocketNotifier)"""
+        return self.reader.fileno()
+
+    def drain(self):
+        """Returns all pending commands without blocking"""
+        commands = []
+        while self.reader.poll():
+            commands.append(self.reader.recv())
+        return commands
+
+    def forward_to_pygame(self, event_type):
+        """
+        Starts a thread that posts a pygame event of event_type, with the
+        command in its `command` attribute, for every command received.
+        """
+        import pygame
+
+        def forward():
+            while True:
+                try:
+                    command = self.reader.recv()
+                except (EOFError, OSError):
+                    return
+                pygame.event.post(pygame.event.Event(event_type, command=command))
+
+        threading.Thread(target=forward, daemon=True, name="commands").start()
@@ -0,0 +1,105 @@
+import asyncio
+
+from shimo3.dedup import AlreadyKnown
+
+
+class ChatOrder:
+    """
+    With concurrent updates the bot handles every update in its own task.
+    Handlers wrapped by ChatOrder run one at a time per chat, in the order
+    the updates arrived, while the updates of different chats still run
+    concurrently: a slow download in one chat does not hold up the others.
+    """
+
+    def __init__(self):
+        # Key: chat id
+        # Value: [lock, number of updates holding or waiting for it]
+        self.locks = {}
+
+    def wrap(self, handler):
+        async def ordered(update, context):
+            chat = update.effective_chat.id if update.effective_chat else None
+            entry = self.locks.setdefault(chat, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                # asyncio.Lock wakes up its waiters first come, first served
+                async with entry[0]:
+                    return await handler(update, context)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[chat]
+        return ordered
+
+
+class ReplyCoalescer:
+    """
+    Runs the saving of photos sent one by one and confirms them with one
+    reply per burst instead of one per photo, which quickly runs into the
+    flood limits of Telegram when someone sends 30 photos. A burst ends
+    when all its photos are done and nothing new happened in the chat for
+    `quiet` seconds.
+
+    on_burst(chat_id, results) is a coroutine; results are (name, result or
+    exception) in the order the photos arrived.
+    """
+
+    def __init__(self, on_burst, quiet=2.0):
+        self.on_burst = on_burst
+        self.quiet = quiet
+        # Key: chat id
+        # Value: list of (name, task) of the current burst
+        self.bursts = {}
+        # Key: chat id
+        # Value: timer handle of the end of its burst
+        self.timers = {}
+
+    def add(self, chat_id, name, coro):
+        """Runs coro (saving photo `name`) as part of the current burst of chat_id"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.bursts.setdefault(chat_id, []).append((name, task))
+        task.add_done_callback(lambda _: self.restart(chat_id))
+        self.restart(chat_id)
+
+    def restart(self, chat_id):
+        timer = self.timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        burst = self.bursts.get(chat_id)
+        if burst and all(task.done() for _, task in burst):
+            self.timers[chat_id] = asyncio.get_running_loop().call_later(self.quiet, self.flush, chat_id)
+
+    def flush(self, chat_id):
+        self.timers.pop(chat_id, None)
+        burst = self.bursts.pop(chat_id, [])
+        results = []
+        for name, task in burst:
+            if task.cancelled():
+                # e.g. on shutdown, reported as failed
+                results.append((name, asyncio.CancelledError("cancelled")))
+            else:
+                results.append((name, task.exception() or task.result()))
+        if results:
+            asyncio.get_running_loop().create_task(self.on_burst(chat_id, results))
+
+
+def burst_summary(results):
+    """
+    Confirmation of a ReplyCoalescer burst. Plain text, not Markdown: file
+    names and error messages may contain _ or *.
+    """
+    if len(results) == 1:
+        name, result = results[0]
+        if isinstance(result, AlreadyKnown):
+            return f"ℹ️ This photo is already in the library as {result.args[0]}"
+        if isinstance(result, BaseException):
+            return f"❌ Failed to save photo: {result}"
+        return f"✅ Saved single photo as {name}"
+    known = sum(1 for _, r in results if isinstance(r, AlreadyKnown))
+    failed = [r for _, r in results if isinstance(r, BaseException) and not isinstance(r, AlreadyKnown)]
+    text = f"✅ Saved {len(results) - known - len(failed)} photos."
+    if known:
+        text += f" {known} were already in the library."
+    if failed:
+        text += f" ❌ {len(failed)} failed: {failed[0]}"
+    return text
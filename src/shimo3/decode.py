@@ -0,0 +1,41 @@
+import math
+
+import pygame
+
+# Pillow is optional (pip install shimo[fast]), without it pygame decodes
+# every image at full resolution
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# EXIF orientations that rotate the image by 90 degrees
+ROTATED = (5, 6, 7, 8)
+ORIENTATION_TAG = 0x0112
+
+
+def decode_image(path, screen_size=None):
+    """
+    Decodes path as a pygame surface. With Pillow, a JPEG larger than needed
+    to cover screen_size is decoded directly at 1/2, 1/4 or 1/8 of its size
+    (DCT scaling, the smallest that still covers the screen), and the EXIF
+    orientation is applied. Otherwise the image is decoded at full size.
+    """
+    if Image is None:
+        return pygame.image.load(path)
+
+    with Image.open(path) as img:
+        if screen_size and img.format == "JPEG":
+            sw, sh = screen_size
+            if img.getexif().get(ORIENTATION_TAG, 1) in ROTATED:
+                # the stored pixels are rotated with respect to the screen
+                sw, sh = sh, sw
+            w, h = img.size
+            scale = max(sw / w, sh / h)
+            if scale < 1:
+                img.draft("RGB", (math.ceil(w * scale), math.ceil(h * scale)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if alpha else "RGB")
+        return pygame.image.frombuffer(img.tobytes(), img.size, img.mode)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+
+from shimo3.index import is_image
+
+
+class AlreadyKnown(Exception):
+    """Raised when a photo is already in the library, args[0] is its filename"""
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DedupIndex:
+    """
+    Persistent index of the photos already in the library, keyed by
+    Telegram's file_unique_id (checked before downloading) and by content
+    hash (for forwarded copies and for files copied into the folder by other
+    means). It is an append-only log loaded into dicts at start-up, so
+    lookups are O(1) however big the library gets.
+    """
+
+    def __init__(self, folder, path=None):
+        self.folder = folder
+        self.path = path or os.path.join(folder, ".dedup")
+        self.lock = threading.Lock()
+        # Key: file_unique_id / content hash
+        # Value: filename in folder
+        self.unique_ids = {}
+        self.hashes = {}
+        # filenames whose hash is known
+        self.files = set()
+        # Keys claimed by the photos being ingested, see claim()
+        # Key: file_unique_id / content hash
+        # Value: filename being ingested
+        self.pending_ids = {}
+        self.pending_hashes = {}
+
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 3:
+                        continue  # truncated by a crash
+                    kind, key, filename = fields
+                    if kind == "u":
+                        self.unique_ids[key] = filename
+                    elif kind == "h":
+                        self.hashes[key] = filename
+                        self.files.add(filename)
+        except FileNotFoundError:
+            pass
+        self.log = open(self.path, "a")
+
+    def _lookup(self, table, key):
+        with self.lock:
+            return self._holder(table, key)
+
+    def _holder(self, table, key):
+        filename = table.get(key)
+        # a photo deleted from the folder can be received again
+        if filename is None or not os.path.exists(os.path.join(self.folder, filename)):
+            return None
+        return filename
+
+    def known_id(self, unique_id):
+        """Filename of the photo with this file_unique_id, None if not in the library"""
+        return self._lookup(self.unique_ids, unique_id)
+
+    def known_hash(self, digest):
+        """Filename of the photo with this content hash, None if not in the library"""
+        return self._lookup(self.hashes, digest)
+
+    def claim(self, filename, unique_id=None, digest=None):
+        """
+        Reserves unique_id and digest for filename while it is ingested, so
+        that the same photo received twice at once is only saved once.
+        Returns the filename already holding one of them, in the library or
+        being ingested, or None if they are now reserved for filename.
+        add() the photo once it is saved and release() the keys in any case.
+        """
+        with self.lock:
+            for table, pending, key in ((self.unique_ids, self.pending_ids, unique_id),
+                                        (self.hashes, self.pending_hashes, digest)):
+                if key:
+                    holder = pending.get(key) or self._holder(table, key)
+                    if holder is not None and holder != filename:
+                        return holder
+            if unique_id:
+                self.pending_ids[unique_id] = filename
+            if digest:
+                self.pending_hashes[digest] = filename
+        return None
+
+    def release(self, filename, unique_id=None, digest=None):
+        """Drops the keys claimed by filename (only those, not the ones of other photos)"""
+        with self.lock:
+            for pending, key in ((self.pending_ids, unique_id), (self.pending_hashes, digest)):
+                if key and pending.get(key) == filename:
+                    del pending[key]
+
+    def add(self, filename, unique_id=None, digest=None):
+        with self.lock:
+            if unique_id:
+                self.unique_ids[unique_id] = filename
+                self.log.write(f"u\t{unique_id}\t{filename}\n")
+            if digest:
+                self.hashes[digest] = filename
+                self.files.add(filename)
+                self.log.write(f"h\t{digest}\t{filename}\n")
+            self.log.flush()
+
+    def import_folder(self):
+        """Hashes the images of the folder that are not indexed yet (e.g. copied by hand)"""
+        with self.lock:
+            known = set(self.files)
+        for entry in os.scandir(self.folder):
+            if is_image(entry.name) and entry.name not in known:
+                try:
+                    digest = file_hash(entry.path)
+                except OSError:
+                    continue
+                if self.known_hash(digest) is None:
+                    self.add(entry.name, digest=digest)
+                else:
+                    # a copy of another image, keep pointing to the first one
+                    with self.lock:
+                        self.files.add(entry.name)
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import time
+
+
+class Downloader:
+    """
+    Downloads Telegram photos concurrently, at most `concurrency` at a time
+    and each one bounded by `timeout` seconds. The get_file() call is done
+    here too, so handlers do not pay a round-trip per photo before the
+    album is even complete.
+    """
+
+    def __init__(self, concurrency=4, timeout=30, metrics=None):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.metrics = metrics
+
+    async def download(self, photo, path):
+        """Downloads photo (a PhotoSize) to path"""
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                file = await asyncio.wait_for(photo.get_file(), self.timeout)
+                await asyncio.wait_for(file.download_to_drive(path), self.timeout)
+            except BaseException as e:
+                # do not leave half-written files around
+                if os.path.exists(path):
+                    os.remove(path)
+                if isinstance(e, asyncio.TimeoutError):
+                    # its message is empty, the user would get no reason
+                    raise TimeoutError(f"download timed out after {self.timeout}s") from e
+                raise
+            if self.metrics:
+                self.metrics.observe("download", (time.perf_counter() - start) * 1000)
+                self.metrics.count("download_bytes", os.path.getsize(path))
+                self.metrics.count("photos")
+
+    async def download_all(self, jobs):
+        """
+        Downloads all (photo, path) jobs concurrently.
+        Returns a list with None or the exception raised for each job.
+        """
+        return await asyncio.gather(*(self.download(photo, path) for photo, path in jobs),
+                                    return_exceptions=True)
@@ -0,0 +1,209 @@
+import math
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import pygame
+
+from shimo3.decode import decode_image
+from shimo3.zoom import build_pyramid
+
+# Bytes per pixel of the frames in the ring (RGB)
+DEPTH = 3
+
+
+def decode_frame(path, screen_size, capacity):
+    """
+    Decodes path for a screen of screen_size: resized to just cover the
+    screen (never enlarged) and further if its pyramid would take more than
+    capacity bytes. Returns the pyramid levels.
+    """
+    img = decode_image(path, screen_size)
+    if img.get_bitsize() not in (24, 32):
+        # palette or 16-bit: convert() needs a display, not available here
+        rgb = pygame.Surface(img.get_size(), 0, 24)
+        rgb.blit(img, (0, 0))
+        img = rgb
+    sw, sh = screen_size
+    w, h = img.get_size()
+    # the whole pyramid takes less than 4/3 of the first level
+    scale = min(1.0, max(sw / w, sh / h), math.sqrt(capacity / (DEPTH * w * h * 4 / 3)))
+    if scale < 1:
+        img = pygame.transform.smoothscale(img, (max(1, int(w * scale)), max(1, int(h * scale))))
+    return build_pyramid(img)
+
+
+def decoder_main(names, capacity, requests, results):
+    """
+    Decoder process: takes (slot, path, screen_size) requests, writes the
+    RGB pixels of the pyramid levels one after the other into the shared
+    memory of the slot and answers (slot, path, layout, ms, error), layout
+    being the ((width, height), offset) of each level.
+    """
+    memories = [shared_memory.SharedMemory(name) for name in names]
+    tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        slot, path, screen_size = request
+        start = time.perf_counter()
+        try:
+            layout = []
+            offset = 0
+            for level in decode_frame(path, screen_size, capacity):
+                data = tobytes(level, "RGB")
+                memories[slot].buf[offset:offset + len(data)] = data
+                layout.append((level.get_size(), offset))
+                offset += len(data)
+            results.put((slot, path, layout, (time.perf_counter() - start) * 1000, None))
+        except Exception as e:
+            results.put((slot, path, None, 0, f"{type(e).__name__}: {e}"))
+    for memory in memories:
+        memory.close()
+
+
+class FramePrefetcher:
+    """
+    Prefetcher that decodes in separate processes, so decoding does not
+    compete with the render loop for the GIL. Decoded frames are handed over
+    in a ring of shared memory slots and wrapped as surfaces without copying.
+
+    Each slot belongs either to the render loop (free, decoded and waiting,
+    or on screen) or to a decoder (requested). A slot goes back to the free
+    list when the frame on it is replaced on screen by the next one, or when
+    a decode that is no longer wanted comes back.
+    """
+
+    def __init__(self, screen_size, depth=3, workers=2, metrics=None):
+        self.screen_size = tuple(screen_size)
+        self.depth = depth
+        self.metrics = metrics
+        # room for the pyramid of an image with 3 times the screen's pixels
+        sw, sh = self.screen_size
+        capacity = int(DEPTH * sw * sh * 3 * 4 / 3)
+        # the prefetched frames, the one on screen and one spare
+        self.memories = [shared_memory.SharedMemory(create=True, size=capacity) for _ in range(depth + 2)]
+        self.free = list(range(len(self.memories)))
+        # Key: path as string
+        # Value: slot being decoded
+        self.pending = {}
+        # Key: path as string
+        # Value: (slot, layout), or (None, error message) if it failed
+        self.done = {}
+        # slots being decoded for paths that are not wanted anymore
+        self.stale = set()
+        self.shown = None
+
+        # spawn: the display process runs threads, forking it is not safe
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        names = [memory.name for memory in self.memories]
+        self.workers = [context.Process(target=decoder_main, args=(names, capacity, self.requests, self.results),
+                                        daemon=True, name="decoder") for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def request(self, path):
+        slot = self.free.pop()
+        self.pending[path] = slot
+        self.requests.put((slot, path, self.screen_size))
+
+    def collect(self, block):
+        """Takes one result from the decoders, False if there was none"""
+        try:
+            slot, path, layout, ms, error = self.results.get(block)
+        except queue.Empty:
+            return False
+        if slot in self.stale:
+            self.stale.discard(slot)
+            self.free.append(slot)
+        elif error is not None:
+            del self.pending[path]
+            self.free.append(slot)
+            self.done[path] = (None, error)
+        else:
+            del self.pending[path]
+            self.done[path] = (slot, layout)
+            if self.metrics:
+                self.metrics.observe("decode", ms)
+        return True
+
+    def schedule(self, paths):
+        """
+        Starts decoding the first `depth` entries of paths and drops
+        everything else that was scheduled before (e.g. after a reshuffle).
+        """
+        while self.collect(block=False):
+            pass
+        wanted = [str(p) for p in paths[:self.depth]]
+        for p in list(self.done):
+            if p not in wanted:
+                slot, _ = self.done.pop(p)
+                if slot is not None:
+                    self.free.append(slot)
+        for p in list(self.pending):
+            if p not in wanted:
+                self.stale.add(self.pending.pop(p))
+        for p in wanted:
+            if p not in self.pending and p not in self.done and self.free:
+                self.request(p)
+
+    def get(self, path):
+        """
+        Returns the pyramid of path, wrapping the shared memory of its slot.
+        Waits for the decoders if it is not ready. From now on the surfaces
+        of the previous frame must not be drawn anymore.
+        """
+        path = str(path)
+        if path not in self.pending and path not in self.done:
+            while not self.free:
+                if self.pending or self.stale:
+                    self.collect(block=True)
+                else:
+                    # every slot holds a prefetched frame, give one up
+                    slot, _ = self.done.pop(next(iter(self.done)))
+                    self.free.append(slot)
+            self.request(path)
+        while path not in self.done:
+            self.collect(block=True)
+
+        slot, layout = self.done.pop(path)
+        if slot is None:
+            raise RuntimeError(layout)
+        pyramid = self.wrap(slot, layout)
+        if self.shown is not None:
+            self.free.append(self.shown)
+        self.shown = slot
+        return pyramid
+
+    def ready(self, path):
+        """
+        The pyramid of path if it is already decoded, None otherwise. Its
+        slot is still recycled, the surfaces are only valid until the next
+        schedule() or get(): copy them to keep them.
+        """
+        slot, layout = self.done.get(str(path), (None, None))
+        if slot is None:
+            return None
+        return self.wrap(slot, layout)
+
+    def wrap(self, slot, layout):
+        buf = self.memories[slot].buf
+        return [pygame.image.frombuffer(buf[offset:offset + w * h * DEPTH], (w, h), "RGB")
+                for (w, h), offset in layout]
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join(timeout=1)
+        for memory in self.memories:
+            try:
+                memory.close()
+            except BufferError:
+                # still wrapped by the surfaces on screen
+                pass
+            memory.unlink()
@@ -0,0 +1,66 @@
+import os
+import time
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+
+def is_image(name):
+    # hidden and temporary files (".part", ".tmp") are never images
+    return not name.startswith(".") and name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class FolderIndex:
+    """
+    In-memory list of the images of a folder. The folder is scanned once,
+    after that poll() looks at the directory mtime (one stat) and only when
+    it changed lists the names again and reports what was added and removed,
+    so callers can update their playlists in O(changes).
+    """
+
+    def __init__(self, folder, interval=1.0):
+        self.folder = folder
+        self.interval = interval
+        self.checked_at = 0
+        self.mtime = None
+        self.paths = set()
+        self.poll(force=True)
+
+    def _scan(self):
+        try:
+            with os.scandir(self.folder) as it:
+                return {entry.path for entry in it if is_image(entry.name)}
+        except FileNotFoundError:
+            return set()
+
+    def poll(self, force=False):
+        """
+        Returns (added, removed) lists of paths since the previous call.
+        Checks the folder at most every `interval` seconds unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.interval:
+            return [], []
+        self.checked_at = now
+
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime and not force:
+            return [], []
+        self.mtime = mtime
+
+        paths = self._scan()
+        added = list(paths - self.paths)
+        removed = list(self.paths - paths)
+        self.paths = paths
+        return added, removed
+
+    def files(self):
+        return list(self.paths)
+
+    def __contains__(self, path):
+        return path in self.paths
+
+    def __len__(self):
+        return len(self.paths)
@@ -0,0 +1,131 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from shimo3.dedup import AlreadyKnown, file_hash
+
+
+def resize_to(src, dst, size):
+    """
+    Runs in a worker process. Decodes src and, if it is larger than needed
+    to cover a screen of the given size, resizes it and writes it to dst.
+    Returns the new size, or None when src is already small enough (nothing
+    is written).
+    """
+    import pygame
+
+    sw, sh = size
+    img = pygame.image.load(src)
+    w, h = img.get_size()
+    # the slideshow zooms until the image covers the screen, so this is the
+    # largest size that will ever be shown
+    scale = max(sw / w, sh / h)
+    if scale >= 1:
+        return None
+    if img.get_bitsize() not in (24, 32):
+        # palette or 16-bit: convert() needs a display, not available here
+        rgb = pygame.Surface(img.get_size(), 0, 24)
+        rgb.blit(img, (0, 0))
+        img = rgb
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    img = pygame.transform.smoothscale(img, size)
+    pygame.image.save(img, dst)
+    return size
+
+
+class Ingestor:
+    """
+    Brings downloaded photos into the image folder. Files are downloaded to
+    a hidden staging folder, resized to the display resolution in a process
+    pool (so the display never has to) and finally renamed into place, so
+    a half-written image can never be seen by the slideshow.
+    With a DedupIndex, photos already in the library raise AlreadyKnown,
+    before downloading when Telegram's file_unique_id is known.
+    With a Catalog, the photo and what is known about it are recorded there.
+    """
+
+    def __init__(self, folder, downloader, size=None, workers=2, dedup=None, catalog=None):
+        self.folder = folder
+        self.downloader = downloader
+        self.dedup = dedup
+        self.catalog = catalog
+        self.size = tuple(size) if size else None
+        self.staging = os.path.join(folder, ".incoming")
+        os.makedirs(self.staging, exist_ok=True)
+        self.pool = None
+        if self.size:
+            # spawn: the bot process runs threads, forking it is not safe
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def ingest(self, photo, filename, **info):
+        """
+        Downloads photo and stores it as filename, returns the final path.
+        info holds the catalog fields (caption, sender_id, chat_id...).
+        """
+        part = os.path.join(self.staging, filename + ".part")
+        resized = os.path.join(self.staging, "resized_" + filename)
+        final = os.path.join(self.folder, filename)
+
+        if self.dedup:
+            # also taken while another copy of the photo is being ingested
+            known = self.dedup.claim(filename, unique_id=photo.file_unique_id)
+            if known:
+                raise AlreadyKnown(known)
+
+        digest = None
+        try:
+            await self.downloader.download(photo, part)
+
+            if self.dedup:
+                digest = await asyncio.get_running_loop().run_in_executor(None, file_hash, part)
+                known = self.dedup.claim(filename, digest=digest)
+                if known:
+                    # same picture uploaded again, remember its id too
+                    self.dedup.add(known, photo.file_unique_id)
+                    raise AlreadyKnown(known)
+
+            resized_size = None
+            if self.pool is not None:
+                start = time.perf_counter()
+                try:
+                    resized_size = await asyncio.get_running_loop().run_in_executor(
+                        self.pool, resize_to, part, resized, self.size)
+                except Exception as e:
+                    print(f"ERROR resizing {filename}, keeping the original: {e}")
+                    resized_size = None
+                if self.downloader.metrics:
+                    self.downloader.metrics.observe("ingest_resize", (time.perf_counter() - start) * 1000)
+
+            if self.catalog:
+                # recorded before the file appears, so the displays never
+                # see it without its caption
+                width, height = resized_size or (photo.width, photo.height)
+                self.catalog.add(filename, width=width, height=height, file_unique_id=photo.file_unique_id,
+                                 content_hash=digest, **info)
+            try:
+                os.replace(resized if resized_size else part, final)
+            except OSError:
+                if self.catalog:
+                    self.catalog.remove(filename)
+                raise
+            if self.dedup:
+                self.dedup.add(filename, photo.file_unique_id, digest)
+            return final
+        finally:
+            for leftover in (part, resized):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            if self.dedup:
+                # saved (and added) or failed, the keys are not reserved anymore
+                self.dedup.release(filename, photo.file_unique_id, digest)
+
+    async def ingest_all(self, jobs):
+        """
+        Ingests all (photo, filename, info) jobs concurrently.
+        Returns a list with the final path or the exception raised for each job
+        (AlreadyKnown for duplicates).
+        """
+        return await asyncio.gather(*(self.ingest(photo, filename, **info) for photo, filename, info in jobs),
+                                    return_exceptions=True)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (ms) of the histogram buckets, the last bucket is unbounded
+BUCKETS = (1, 2, 5, 10, 16, 20, 33, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        i = 0
+        while i < len(BUCKETS) and ms > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def to_dict(self):
+        return {"count": self.count, "total": round(self.total, 3), "max": round(self.max, 3),
+                "buckets": self.counts}
+
+
+def percentile(histogram, p):
+    """Upper bound (ms) of the bucket containing the p-th percentile"""
+    target = histogram["count"] * p / 100
+    seen = 0
+    for i, n in enumerate(histogram["buckets"]):
+        seen += n
+        if n and seen >= target:
+            return BUCKETS[i] if i < len(BUCKETS) else histogram["max"]
+    return 0
+
+
+class Metrics:
+    """
+    Latency histograms (in ms) and counters. They are cheap to update from
+    the render loop and are periodically written as a JSON snapshot to
+    `path`, so that other processes (the bot) can read and report them.
+    """
+
+    def __init__(self, path=None, interval=10):
+        self.path = path
+        self.interval = interval
+        self.started = time.time()
+        self.dumped_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, ms):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(ms)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {"since": self.started,
+                    "time": time.time(),
+                    "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+                    "counters": dict(self.counters),
+                    "gauges": dict(self.gauges)}
+
+    def dump(self, force=False):
+        """Writes the snapshot to path, at most every `interval` seconds unless forced"""
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.dumped_at < self.interval:
+            return
+        self.dumped_at = now
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"ERROR writing stats to {self.path}: {e}")
+
+
+def load(path):
+    """Reads a snapshot written by Metrics.dump, None if not available"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def summary(snapshot, title):
+    """Human readable text for a snapshot, used by the /stats command"""
+    if not snapshot:
+        return f"{title}: no data"
+    lines = [f"{title} ({int(snapshot['time'] - snapshot['since'])}s of data):"]
+    for name, h in sorted(snapshot["histograms"].items()):
+        if h["count"]:
+            lines.append(f"  {name}: n={h['count']} avg={h['total'] / h['count']:.1f}ms "
+                         f"p95<={percentile(h, 95):.0f}ms max={h['max']:.0f}ms")
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"  {name}: {value}")
+    for name, value in sorted(snapshot.get("gauges", {}).items()):
+        lines.append(f"  {name}: {value}")
+    return "\n".join(lines)
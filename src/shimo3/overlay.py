@@ -0,0 +1,45 @@
+import pygame
+
+
+class TextOverlay:
+    """
+    A line of text drawn over the slides. It is rendered to a surface only
+    when the text changes, and remembers where it was last drawn so that
+    just that region needs to be refreshed on screen.
+    """
+
+    def __init__(self, font, place, color=(255, 255, 255)):
+        self.font = font
+        # place(width, height) -> (x, y) top left corner for a surface of that size
+        self.place = place
+        self.color = color
+        self.text = None
+        self.surface = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.drawn_rect = None
+        self.dirty = True
+
+    def set_text(self, text):
+        if text == self.text:
+            return
+        self.text = text
+        self.surface = self.font.render(text, True, self.color)
+        self.rect = self.surface.get_rect(topleft=self.place(*self.surface.get_size()))
+        self.dirty = True
+
+    def draw(self, screen):
+        screen.blit(self.surface, self.rect)
+        self.drawn_rect = self.rect
+        self.dirty = False
+
+    def redraw(self, screen, background):
+        """
+        Restores background where the old text was, draws the new one and
+        returns the rectangles that changed on screen.
+        """
+        rects = [self.rect]
+        if self.drawn_rect is not None:
+            screen.blit(background, self.drawn_rect, self.drawn_rect)
+            rects.append(self.drawn_rect)
+        self.draw(screen)
+        return rects
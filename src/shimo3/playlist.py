@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import random
+
+
+class Playlist:
+    """
+    Shuffled order of the images plus a priority lane for the ones just
+    received, which are shown next (oldest first) without touching the rest
+    of the shuffled order. Adding a new image is O(log n); removed images are
+    simply skipped when their turn comes. The last images shown are kept so
+    that prev() can go back and next() forward again through them.
+    """
+
+    def __init__(self, items=(), history=100):
+        self.members = set(items)
+        self.order = []
+        self.position = 0
+        # number of images shown since the last reshuffle
+        self.shown = 0
+        # heap of (arrival number, path)
+        self.priority = []
+        self.arrivals = itertools.count()
+        # images shown, the last one is the newest
+        self.history = []
+        self.history_size = history
+        # how many steps back in history we are, 0 when showing the newest
+        self.back = 0
+        # changes with every reshuffle, tells which order a state() belongs to
+        self.round = 0
+        self.reshuffle()
+
+    def reshuffle(self):
+        self.round += 1
+        self.order = list(self.members)
+        random.shuffle(self.order)
+        self.position = 0
+        self.shown = 0
+
+    def add(self, path, priority=True):
+        """
+        Adds path to the playlist. With priority it is shown next, otherwise
+        it only joins the shuffled order at the next reshuffle.
+        """
+        if priority:
+            heapq.heappush(self.priority, (next(self.arrivals), path))
+        self.members.add(path)
+
+    def remove(self, path):
+        self.members.discard(path)
+
+    def next(self):
+        """Returns the next image to show, None if the playlist is empty"""
+        while self.back > 0:
+            # forward again through the images we went back over
+            self.back -= 1
+            path = self.history[-1 - self.back]
+            if path in self.members:
+                return path
+        path = self._next()
+        if path is not None:
+            self.history.append(path)
+            del self.history[:-self.history_size]
+        return path
+
+    def prev(self):
+        """Returns the image shown before the current one, None if there is none"""
+        back = self.back
+        while back < len(self.history) - 1:
+            back += 1
+            path = self.history[-1 - back]
+            if path in self.members:
+                self.back = back
+                return path
+        # nothing to go back to, the current image stays
+        return None
+
+    def _next(self):
+        while self.priority:
+            _, path = heapq.heappop(self.priority)
+            if path in self.members:
+                self.shown += 1
+                return path
+        for _ in range(2):
+            while self.position < len(self.order):
+                path = self.order[self.position]
+                self.position += 1
+                if path in self.members:
+                    self.shown += 1
+                    return path
+            # end of the round, start a new one
+            self.reshuffle()
+        return None
+
+    def peek(self, n):
+        """The next n images (at most) that next() would return, for prefetching"""
+        upcoming = [path for path in self.history[len(self.history) - self.back:] if path in self.members]
+        upcoming += [path for _, path in heapq.nsmallest(n, self.priority) if path in self.members]
+        position = self.position
+        while len(upcoming) < n and position < len(self.order):
+            if self.order[position] in self.members:
+                upcoming.append(self.order[position])
+            position += 1
+        return upcoming[:n]
+
+    def state(self):
+        """
+        The position in the playlist as a JSON-friendly dict, see restore().
+        It is small: the shuffled order, which only changes with the round,
+        is saved apart with order_state().
+        """
+        return {"round": self.round, "position": self.position, "shown": self.shown,
+                "priority": [path for _, path in sorted(self.priority)],
+                "history": self.history, "back": self.back}
+
+    def order_state(self):
+        return {"round": self.round, "order": self.order}
+
+    def restore(self, state, order_state=None):
+        """
+        Continues from a state() and order_state() saved by a previous run.
+        Images that are not members anymore are dropped, new members join the
+        next reshuffle. Without the order of the same round, a new round starts.
+        """
+        order_state = order_state or {}
+        if state.get("round") is not None and order_state.get("round") == state["round"]:
+            order = order_state.get("order", [])
+            position = state.get("position", 0)
+            self.position = sum(1 for path in order[:position] if path in self.members)
+            self.order = [path for path in order if path in self.members]
+            self.shown = state.get("shown", 0)
+            self.round = state["round"]
+        self.priority = []
+        for path in state.get("priority", []):
+            if path in self.members:
+                heapq.heappush(self.priority, (next(self.arrivals), path))
+        history = state.get("history", [])
+        back = state.get("back", 0)
+        # the image on screen stays the current one
+        self.back = sum(1 for path in history[len(history) - back:] if path in self.members)
+        self.history = [path for path in history if path in self.members][-self.history_size:]
+
+    def current(self):
+        """The image returned by the last next() or prev(), None if there is none"""
+        if self.back < len(self.history):
+            return self.history[-1 - self.back]
+        return None
+
+    def __contains__(self, path):
+        return path in self.members
+
+    def __len__(self):
+        return len(self.members)
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """
+    Prepares the next images of the playlist in background threads, so that
+    switching slide is a dictionary lookup instead of a decode.
+    """
+
+    def __init__(self, loader, depth=3, workers=2):
+        # loader(path) -> prepared image, called from the worker threads
+        self.loader = loader
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        # Key: path as string
+        # Value: Future with the prepared image
+        self.pending = {}
+
+    def schedule(self, paths):
+        """
+        Starts preparing the first `depth` entries of paths and drops
+        everything else that was scheduled before (e.g. after a reshuffle).
+        """
+        wanted = [str(p) for p in paths[:self.depth]]
+        for p in list(self.pending):
+            if p not in wanted:
+                self.pending.pop(p).cancel()
+        for p in wanted:
+            if p not in self.pending:
+                self.pending[p] = self.executor.submit(self.loader, p)
+
+    def get(self, path):
+        """
+        Returns the prepared image for path. If it was not scheduled it is
+        loaded right away, if it is still being prepared we wait for it.
+        """
+        future = self.pending.pop(str(path), None)
+        if future is None:
+            return self.loader(str(path))
+        return future.result()
+
+    def ready(self, path):
+        """The prepared image for path if it is already done, None otherwise"""
+        future = self.pending.get(str(path))
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def shutdown(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=False)
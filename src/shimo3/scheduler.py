@@ -0,0 +1,54 @@
+import time
+from collections import deque
+
+
+def next_minute():
+    """Monotonic time at which the wall clock shows the next minute"""
+    return time.monotonic() + 60 - time.time() % 60
+
+
+class FrameScheduler:
+    """
+    Decides when the display has to draw its next frame. States with a frame
+    rate (frames per second) are redrawn at that rate, e.g. while an
+    animation runs. States with rate 0 are still: the display may sleep until
+    the next deadline it passes in (end of the slide, next minute for the
+    clock...), and at most `max_sleep` seconds. Commands wake it up anyway.
+    """
+
+    def __init__(self, rates, max_sleep=5.0, window=5.0):
+        # Key: state name
+        # Value: frames per second, 0 to wait for the next deadline
+        self.rates = rates
+        self.max_sleep = max_sleep
+        self.window = window
+        self.started = time.monotonic()
+        # monotonic times of the frames drawn in the last `window` seconds
+        self.frames = deque()
+
+    def delay(self, state, deadlines=()):
+        """Seconds to wait before the next frame of state"""
+        rate = self.rates.get(state, 0)
+        if rate:
+            return 1.0 / rate
+        now = time.monotonic()
+        return max(0.0, min([d - now for d in deadlines if d is not None] + [self.max_sleep]))
+
+    def delay_ms(self, state, deadlines=()):
+        """delay() in whole milliseconds, for timers. Deadlines have passed when it expires."""
+        rate = self.rates.get(state, 0)
+        if rate:
+            return round(1000 / rate)
+        return int(self.delay(state, deadlines) * 1000) + 1
+
+    def frame(self):
+        """Records that a frame was drawn"""
+        now = time.monotonic()
+        self.frames.append(now)
+        while now - self.frames[0] > self.window:
+            self.frames.popleft()
+
+    def rate(self):
+        """Effective frames per second over the last `window` seconds"""
+        elapsed = max(1.0, min(self.window, time.monotonic() - self.started))
+        return round(len(self.frames) / elapsed, 1)
@@ -1,25 +1,46 @@
 import multiprocessing
+import threading
 import time
 
+# close enough to the process start, for the time to first frame
+STARTED = time.perf_counter()
+
 import pygame
 import os
-import random
 import os
 import re
 import yaml
 #from telegram import Update
 #from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters, Job
 
-from pathlib import Path
-
-
-def main():
+from shimo3.albums import AlbumAssembler
+from shimo3.cache import ImageCache, MemoryCache, RawCache
+from shimo3.catalog import Catalog, message_info
+from shimo3.chats import ChatOrder, ReplyCoalescer, burst_summary
+from shimo3.channel import CommandChannel, NewImage, Next, Previous, ResetMessage, SetMessage, Shuffle, parse_command
+from shimo3.decode import decode_image
+from shimo3.dedup import AlreadyKnown, DedupIndex
+from shimo3.downloads import Downloader
+from shimo3.framering import FramePrefetcher
+from shimo3.index import FolderIndex
+from shimo3.ingest import Ingestor
+from shimo3.metrics import Metrics, load, summary
+from shimo3.overlay import TextOverlay
+from shimo3.playlist import Playlist
+from shimo3.prefetch import Prefetcher
+from shimo3.scheduler import FrameScheduler, next_minute
+from shimo3.snapshot import Snapshot
+from shimo3.sync import SyncClient, SyncServer
+from shimo3.zoom import build_pyramid, render_zoom
+
+
+def main(config_path="config.yaml"):
     # load config
     try:
-        with open("config.yaml", "r") as f:
+        with open(config_path, "r") as f:
             config = yaml.safe_load(f)
     except Exception as e:
-        print(f"File config.yaml not found or corrupted")
+        print(f"File {config_path} not found or corrupted")
         config = {}
 
     # bot_token: PASTE_YOUR_BOT_TOKEN_HERE
@@ -31,6 +52,30 @@ def main():
     #     - 6416982
     # font_size: 60
     # show_remaining: True
+    # prefetch: 3
+    # cache_folder: ~/.cache/shimo
+    # cache_size: 512
+    # stats_file: ~/.cache/shimo/stats.json
+    # window_size: [800, 600]
+    # max_slides: 0  (quit after this many slides, used by the benchmarks)
+    # download_concurrency: 4
+    # download_timeout: 30
+    # display_size: [1920, 1080]  (received photos are resized to cover it)
+    # ingest_workers: 2
+    # album_quiet: 0.4
+    # album_cap: 3.0
+    # reply_quiet: 2.0  (single photos are confirmed once per burst, this long after the last one)
+    # frame_rates: {zoom: 30, hold: 0}  (frames per second, 0 redraws only when something changes)
+    # sync_port: 8765  (serve the images and commands to other screens, see shimo3.sync)
+    # sync_host: localhost  (address the sync server listens on, e.g. the LAN address; needs sync_token)
+    # sync_token: a-long-secret  (shared by the sync server and its screens)
+    # sync_server: http://host:8765  (be one of those screens instead of running a bot)
+    # sync_group: kitchen  (receive the commands sent with /to kitchen ...)
+    # decoder: thread  (or process: decode in other processes, frames shared in memory)
+    # decoder_workers: 2
+    # surface_cache: 256  (MB of decoded images kept in memory, for going back; thread decoder only)
+    # raw_cache: 0  (MB of decoded pixels kept on disk and memory-mapped, 0 disables it; thread decoder only)
+    # warm_start: 3  (frames kept to show the last slide right away after a restart, 0 disables it)
 
     home_dir = os.path.expanduser("~")
 
@@ -43,19 +88,39 @@ def main():
     font_size = config.get("font_size", 40)
     show_remaining = config.get("show_remaining", True)
     show_time = config.get("show_clock", True)
-
-    # queue to communicate with the bot process
-    queue = multiprocessing.Queue()
-
-    # --- Global Buffer ---
-    # Stores media groups that are still being assembled.
-    # Key: (chat_id, group_id)
-    # Value: List of tuples (message, file, safe_name_base)
-    media_groups: dict[tuple[int, str], list[tuple[any, any, str]]] = {}
+    PREFETCH = config.get("prefetch", 3)
+    CACHE_FOLDER = os.path.expanduser(config.get("cache_folder", home_dir + os.sep + ".cache" + os.sep + "shimo"))
+    CACHE_SIZE = config.get("cache_size", 512)  # MB
+    STATS_FILE = os.path.expanduser(config.get("stats_file", CACHE_FOLDER + os.sep + "stats.json"))
+    WINDOW_SIZE = tuple(config.get("window_size", (800, 600)))
+    MAX_SLIDES = config.get("max_slides", 0)
+    DOWNLOAD_CONCURRENCY = config.get("download_concurrency", 4)
+    DOWNLOAD_TIMEOUT = config.get("download_timeout", 30)
+    DISPLAY_SIZE = config.get("display_size", None)
+    INGEST_WORKERS = config.get("ingest_workers", 2)
+    ALBUM_QUIET = config.get("album_quiet", 0.4)
+    ALBUM_CAP = config.get("album_cap", 3.0)
+    REPLY_QUIET = config.get("reply_quiet", 2.0)
+    FRAME_RATES = {"zoom": hz, "hold": 0}
+    FRAME_RATES.update(config.get("frame_rates", {}))
+    SYNC_PORT = config.get("sync_port", None)
+    SYNC_SERVER = config.get("sync_server", None)
+    SYNC_GROUP = config.get("sync_group", None)
+    SYNC_HOST = config.get("sync_host", "localhost")
+    SYNC_TOKEN = config.get("sync_token", None)
+    DECODER = config.get("decoder", "thread")
+    DECODER_WORKERS = config.get("decoder_workers", 2)
+    SURFACE_CACHE = config.get("surface_cache", 256)  # MB
+    RAW_CACHE = config.get("raw_cache", 0)  # MB
+    WARM_START = config.get("warm_start", 3)
+
+    # channel to receive commands from the bot process
+    channel = CommandChannel()
 
     # Ensure the save directory exists
     if not os.path.exists(FOLDER):
         os.makedirs(FOLDER)
+    os.makedirs(os.path.dirname(STATS_FILE), exist_ok=True)
 
     # --- Helper Function ---
 
@@ -75,57 +140,95 @@ def main():
             # Truncate to a reasonable length
             return text[:50] if text else "unnamed_media"
 
-        # --- Job Queue Callback (Handles the processing after a delay) ---
-        # FIX: The job queue passes the CallbackContext, not the Job object directly.
-        async def process_media_group_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Download statistics, reported by /stats together with the display ones
+        bot_metrics = Metrics()
+        downloader = Downloader(DOWNLOAD_CONCURRENCY, DOWNLOAD_TIMEOUT, bot_metrics)
+        # photos already in the library are not downloaded again
+        dedup = DedupIndex(FOLDER)
+        # downloads are staged, resized and renamed into FOLDER atomically
+        ingestor = Ingestor(FOLDER, downloader, DISPLAY_SIZE, INGEST_WORKERS, dedup, Catalog(FOLDER))
+
+        # other screens pull the images and commands from here
+        sync = SyncServer(FOLDER, SYNC_PORT, SYNC_HOST, token=SYNC_TOKEN) if SYNC_PORT else None
+        if sync:
+            sync.start()
+
+        def image_added(path):
+            channel.send(NewImage(path))
+            if sync:
+                sync.notify()
+
+        def send_command(command, group=None):
+            # this screen is part of SYNC_GROUP
+            if group is None or group == SYNC_GROUP:
+                channel.send(command)
+            if sync:
+                sync.publish(command, group)
+
+        # --- Album Callback (Handles the processing once the group is complete) ---
+        async def process_media_group(key, buf, caption, late) -> None:
             """
-            Processes a complete media group after a short delay.
-            This function is called by the job queue.
+            Processes a complete media group, or the parts of it that arrived late.
+            This function is called by the AlbumAssembler.
             """
-            # Retrieve the job object from the context
-            job = context.job
-            if not job:
-                print("ERROR: Job object not found in context.")
-                return
-
-            # Retrieve chat_id and group_id from the job data (now accessible via context.job.data)
-            chat_id, group_id = job.data
-
-            # Retrieve the bot instance directly from the context
-            bot = context.bot
-
-            # Pop the buffer, ensuring this group is not processed again.
-            buf = media_groups.pop((chat_id, group_id), [])
-            if not buf:
-                # This can happen if the job runs but another job processed it already.
-                print(f"DEBUG: Buffer for group {group_id} was empty.")
-                return
+            chat_id, group_id = key
 
             saved_count = 0
-            file_group_name = ""
-            for msg, file, safe_name_base in buf:
-                if safe_name_base != "unnamed":
-                    file_group_name = safe_name_base
-                    break
-
-            # Download all files in the collected buffer
-            for msg, file, safe_name_base in buf:
-                if file_group_name != "":
-                    safe_name_base = file_group_name
-                try:
-                    # Construct a unique filename
-                    filename = f"{safe_name_base}_{msg.message_id}.jpg"
-                    path = os.path.join(FOLDER, filename)
-
-                    # The 'file' object in the buffer is the File object fetched earlier.
-                    await file.download_to_drive(path)
+            known_count = 0
+            # Late parts get the name of the group they belong to
+            file_group_name = sanitize_filename(caption) if caption else "unnamed"
+
+            # Download all files in the collected buffer, concurrently
+            jobs = []
+            for msg, photo in buf:
+                # Construct a unique filename
+                jobs.append((photo, f"{file_group_name}_{msg.message_id}.jpg", message_info(msg, caption)))
+
+            results = await ingestor.ingest_all(jobs)
+            for (msg, _), (_, filename, _), result in zip(buf, jobs, results):
+                if isinstance(result, AlreadyKnown):
+                    known_count += 1
+                    print(f"Already in the library: {result.args[0]}")
+                elif isinstance(result, BaseException):
+                    print(f"ERROR downloading file {msg.message_id}: {result!r}")
+                else:
                     saved_count += 1
+                    image_added(result)
                     print(f"Successfully downloaded1: {filename}")
-                except Exception as e:
-                    print(f"ERROR downloading file {msg.message_id}: {e}")
 
             # Send a single confirmation message for the whole group
-            await bot.send_message(chat_id, f"✅ Saved {saved_count} photos from media group (ID: {group_id}).")
+            if late:
+                text = f"✅ Saved {saved_count} more photos to media group (ID: {group_id})."
+            else:
+                text = f"✅ Saved {saved_count} photos from media group (ID: {group_id})."
+            if known_count:
+                text += f" {known_count} were already in the library."
+            await app.bot.send_message(chat_id, text)
+
+        # Groups are flushed when no part arrives for ALBUM_QUIET seconds, when
+        # they reach 10 photos, or ALBUM_CAP seconds after the first one
+        albums = AlbumAssembler(process_media_group, ALBUM_QUIET, ALBUM_CAP)
+
+        async def save_photo(photo, filename, info):
+            path = await ingestor.ingest(photo, filename, **info)
+            image_added(path)
+            print(f"Successfully downloaded single photo: {filename}")
+            return path
+
+        async def confirm_photos(chat_id, results):
+            for filename, result in results:
+                if isinstance(result, BaseException) and not isinstance(result, AlreadyKnown):
+                    print(f"ERROR downloading single photo {filename}: {result}")
+            try:
+                await app.bot.send_message(chat_id, burst_summary(results))
+            except Exception as e:
+                print(f"ERROR sending confirmation: {e}")
+
+        # Single photos are downloaded concurrently and confirmed with one
+        # reply per burst, a reply per photo runs into the flood limits
+        replies = ReplyCoalescer(confirm_photos, REPLY_QUIET)
+        # updates of the same chat are handled in order, see ChatOrder
+        in_order = ChatOrder()
 
         async def handle_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             """
@@ -148,11 +251,21 @@ def main():
                     "/m <message> - Set a message to display on screen\n"
                     "/reset - Clear the screen message\n"
                     "/shuffle - Shuffle the image order\n"
+                    "/next, /prev - Go to the next or the previous image\n"
+                    "/to <group> <command> - Send a command to a group of screens\n"
+                    "/stats - Show performance statistics\n"
                     "/help - Show this help message",
                     parse_mode='Markdown'
                 )
-            elif command.split(" ")[0] in ["/m", "/reset", "/shuffle"]:
-                queue.put(command)
+            elif command == "/stats":
+                await msg.reply_text(summary(load(STATS_FILE), "Display") + "\n\n" +
+                                     summary(bot_metrics.snapshot(), "Bot"))
+            elif command.startswith("/to ") and parse_command(command.split(" ", 2)[-1]) is not None:
+                _, group, text = command.split(" ", 2)
+                send_command(parse_command(text), group)
+                await msg.reply_text(f"OK!")
+            elif parse_command(command) is not None:
+                send_command(parse_command(command))
                 await msg.reply_text(f"OK!")
             else:
                 await msg.reply_text(f"❓ Unknown command: {command}")
@@ -178,72 +291,143 @@ def main():
             caption = msg.caption or "unnamed"
             safe_name_base = sanitize_filename(caption)
 
-            # Get the highest resolution file object
+            # Get the highest resolution photo, its file is fetched when downloading
             # The photo list is sorted by size; [-1] is the largest.
-            file = await msg.photo[-1].get_file()
+            photo = msg.photo[-1]
 
             if group_id:
-                # 1. Add the photo to the temporary buffer
-                buf = media_groups.setdefault((msg.chat_id, group_id), [])
-                buf.append((msg, file, safe_name_base))
-
-                # 2. Schedule the processing job only when the FIRST photo arrives
-                if len(buf) == 1:
-                    # Schedule the job to run after 1 second (to allow time for all group members to arrive)
-                    context.application.job_queue.run_once(
-                        process_media_group_job,
-                        1.0,  # Delay in seconds
-                        data=(msg.chat_id, group_id),
-                        name=f"media_group_{group_id}"
-                    )
+                # Add the photo to its group, processed when the group is complete
+                albums.add((msg.chat_id, group_id), (msg, photo), msg.caption)
 
             else:
-                # Handle single photos immediately
+                # Single photos start downloading immediately, the next
+                # updates of the chat do not wait for them
                 filename = f"{safe_name_base}_{msg.message_id}.jpg"
-                path = os.path.join(FOLDER, filename)
-
-                try:
-                    await file.download_to_drive(path)
-                    await msg.reply_text(f"✅ Saved single photo as `{filename}`", parse_mode='Markdown')
-                    print(f"Successfully downloaded single photo: {filename}")
-                except Exception as e:
-                    await msg.reply_text(f"❌ Failed to save photo: {e}")
-                    print(f"ERROR downloading single photo {msg.message_id}: {e}")
+                replies.add(msg.chat_id, filename, save_photo(photo, filename, message_info(msg)))
 
 
         print("🤖 Bot is starting... Press Ctrl+C to stop.")
-        # Includes job_queue by default for scheduling tasks
-        app = ApplicationBuilder().token(BOT_TOKEN).build()
+        # the updates of different chats are handled concurrently
+        app = ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(True).build()
+
+        # index the files that were copied into the folder by other means
+        threading.Thread(target=dedup.import_folder, daemon=True).start()
 
         # Add handler for photos (handles both single and media group photos)
-        app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-        app.add_handler(MessageHandler(filters.COMMAND, handle_command))
+        app.add_handler(MessageHandler(filters.PHOTO, in_order.wrap(handle_photo)))
+        app.add_handler(MessageHandler(filters.COMMAND, in_order.wrap(handle_command)))
 
         # print("🤖 Bot is starting... Press Ctrl+C to stop.")
         app.run_polling()
 
-    if not BOT_TOKEN:
+    # forked before the display exists, telegram is only imported by the child
+    if SYNC_SERVER:
+        print(f"Showing the images of {SYNC_SERVER}, NOT starting bot.")
+    elif not BOT_TOKEN:
         print("Bot token not set in config.yaml, NOT starting bot.")
     else:
         bot_process = multiprocessing.Process(target=run_bot)
         bot_process.start()
 
     pygame.init()
-    screen = pygame.display.set_mode((800, 600), pygame.RESIZABLE)
+    screen = pygame.display.set_mode(WINDOW_SIZE, pygame.RESIZABLE)
     sw, sh = screen.get_size()
     font = pygame.font.SysFont(None, font_size)
 
+    # Timing of the render loop and of the image pipeline, see /stats
+    metrics = Metrics(STATS_FILE)
+
+    def to_display_format(img):
+        # JPEGs have no alpha: opaque surfaces take less memory and blit faster
+        if img.get_flags() & pygame.SRCALPHA:
+            return img.convert_alpha()
+        return img.convert()
+
+    # Warm start: the last slide goes back on screen from the snapshot before
+    # anything slow (folder scan, catalog, decoders) is started
+    snapshot = Snapshot(os.path.join(CACHE_FOLDER, "snapshot"))
+    saved = snapshot.load() if WARM_START else {}
+    message = saved.get("message", "")
+    current_path = saved.get("current")
+    warm_frame = snapshot.frame(current_path) if current_path else None
+    pyramid = None
+    if warm_frame is not None:
+        try:
+            pyramid = build_pyramid(to_display_format(pygame.image.load(warm_frame)))
+            scaled, pos = render_zoom(pyramid, 0.3, (sw, sh))
+            screen.fill((0, 0, 0))
+            if scaled is not None:
+                screen.blit(scaled, pos)
+            pygame.display.flip()
+        except Exception as e:
+            print(f"Snapshot frame {warm_frame} not usable: {e}")
+            pyramid = None
+    first_frame_shown = pyramid is not None
+    if first_frame_shown:
+        metrics.observe("first_frame", (time.perf_counter() - STARTED) * 1000)
+
+    # Commands from the bot arrive as pygame events, all pending ones are
+    # handled together with the other events of the frame
+    COMMAND_EVENT = pygame.event.custom_type()
+    channel.forward_to_pygame(COMMAND_EVENT)
+
+    # The screen resolution is needed by the prefetch threads, read it once here
+    info = pygame.display.Info()
+    screen_width, screen_height = info.current_w, info.current_h
+
+    if SYNC_SERVER:
+        # mirror the images of the bot's screen, resized for this one
+        SyncClient(SYNC_SERVER, FOLDER, (screen_width, screen_height), channel, SYNC_GROUP, SYNC_TOKEN).start()
+
+    # Captions, view counts... of the images, written by the bot
+    catalog = Catalog(FOLDER)
+
+    # Images resized for this screen, the originals are never modified
+    cache = ImageCache(CACHE_FOLDER, budget=CACHE_SIZE * 1024 * 1024)
+    # Pyramids ready to draw, used straight from the mapped files
+    raw_cache = RawCache(os.path.join(CACHE_FOLDER, "raw"), RAW_CACHE * 1024 * 1024) if RAW_CACHE else None
+    tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+
+    def make_pyramid(key, img):
+        # Pre-compute the mipmaps used by render_zoom
+        with metrics.timer("mipmaps"):
+            pyramid = build_pyramid(img)
+        if raw_cache is not None:
+            fmt = "RGBA" if img.get_flags() & pygame.SRCALPHA else "RGBX"
+            raw_cache.store_levels(key, fmt, [(level.get_size(), level.get_width() * 4, tobytes(level, fmt))
+                                              for level in pyramid])
+        return pyramid
+
     def load_image(path):
         """
-        Carga una imagen, redimensiona si es demasiado grande según la pantalla
-        y guarda el resultado en el mismo archivo.
+        Carga una imagen, redimensiona si es demasiado grande según la pantalla.
+        La versión redimensionada se guarda en la caché, no sobre el original.
+        Se ejecuta en los hilos del Prefetcher, no en el bucle principal.
         """
-        # Inicializar pantalla temporal para obtener resolución
-        pygame.init()
-        info = pygame.display.Info()
-        screen_width, screen_height = info.current_w, info.current_h
-
-        img = pygame.image.load(path).convert_alpha()
+        key = cache.key(path, (screen_width, screen_height))
+        catalog.set_cache_key(os.path.basename(path), key)
+        if raw_cache is not None:
+            raw = raw_cache.load_levels(key)
+            if raw is not None:
+                fmt, levels = raw
+                metrics.count("raw_hits")
+                return [pygame.image.frombuffer(pixels, size, fmt) for size, _, pixels in levels]
+            metrics.count("raw_misses")
+        cached = cache.lookup(key)
+        if cached is not None:
+            try:
+                with metrics.timer("decode_cached"):
+                    img = to_display_format(pygame.image.load(cached))
+                metrics.count("cache_hits")
+                return make_pyramid(key, img)
+            except Exception as e:
+                # evicted meanwhile or corrupted, regenerate it
+                print(f"Cache entry {key} not usable: {e}")
+        metrics.count("cache_misses")
+
+        with metrics.timer("decode"):
+            # JPEGs are decoded at reduced size when Pillow is available
+            img = to_display_format(decode_image(path, (screen_width, screen_height)))
         w, h = img.get_size()
         new_w, new_h = w, h
 
@@ -258,54 +442,187 @@ def main():
                 new_w = int(w * (screen_height / h))
 
         if (new_w, new_h) != (w, h):
-            img = pygame.transform.smoothscale(img, (new_w, new_h))
-            # Guardar imagen redimensionada con el mismo nombre
-            pygame.image.save(img, path)
+            with metrics.timer("resize"):
+                img = pygame.transform.smoothscale(img, (new_w, new_h))
+            cache.store(key, lambda tmp: pygame.image.save(img, tmp))
 
-        return img
+        return make_pyramid(key, img)
+
+    if DECODER == "process":
+        # no GIL contention with the render loop, frames arrive in shared memory
+        prefetcher = FramePrefetcher((screen_width, screen_height), PREFETCH, DECODER_WORKERS, metrics)
+    else:
+        prefetcher = Prefetcher(load_image, depth=PREFETCH)
+
+    # The last images shown stay decoded, going back to them is instant. The
+    # frames of the decoder processes live in recycled shared memory, they
+    # cannot be kept.
+    surfaces = MemoryCache(SURFACE_CACHE * 1024 * 1024 if DECODER != "process" else 0)
+
+    def fetch(path):
+        pyramid = surfaces.get(path)
+        if pyramid is not None:
+            metrics.count("surface_hits")
+        else:
+            metrics.count("surface_misses")
+            pyramid = prefetcher.get(path)
+            surfaces.put(path, pyramid, sum(level.get_pitch() * level.get_height() for level in pyramid))
+        metrics.gauge("surface_hit_rate", surfaces.hit_rate())
+        metrics.gauge("surface_cache_mb", round(surfaces.used / 1024 / 1024, 1))
+        return pyramid
+
+    def prefetch():
+        prefetcher.schedule([p for p in playlist.peek(PREFETCH) if p not in surfaces])
 
     def calc_target_scale(img):
         iw, ih = img.get_size()
         return max(sw / iw, sh / ih)
 
-    def load_file_list():
-        lst = []
-        for f in os.listdir(FOLDER):
-            p = Path(FOLDER) / f
-            if p.suffix.lower() in [".jpg", ".jpeg", ".png", ".bmp", ".gif"]:
-                lst.append(p)
-        random.shuffle(lst)
-        return lst
-
-    files = load_file_list()
-    while len(files) == 0:
+    # The folder is scanned only once, then kept up to date incrementally
+    folder_index = FolderIndex(FOLDER)
+    # images copied by hand or deleted while we were not running
+    catalog.sync_all(os.path.basename(p) for p in folder_index.files())
+
+    def load_playlist():
+        # the catalog may already list images the bot is still moving in
+        lst = [os.path.join(FOLDER, f) for f in catalog.filenames()]
+        return Playlist(p for p in lst if p in folder_index)
+
+    def show_caption(path):
+        filename = os.path.basename(path)
+        catalog.record_view(filename)
+        return catalog.caption(filename)
+
+    def frame_writer(img):
+        # copied now, the surfaces of the decoder processes are recycled
+        frame = img.copy()
+
+        def write(tmp):
+            # a frame only needs to cover the window
+            w, h = frame.get_size()
+            scale = max(sw / w, sh / h)
+            small = frame
+            if scale < 1:
+                small = pygame.transform.smoothscale(frame, (max(1, int(w * scale)), max(1, int(h * scale))))
+            pygame.image.save(small, tmp)
+        return write
+
+    def save_snapshot(frames=True):
+        """Saves what is on screen for the next start, with the frames of the next images if ready"""
+        if not WARM_START:
+            return
+        state = {"current": current_path, "message": message, "playlist": playlist.state()}
+        # the shuffled order is large, it is only written when a new round starts
+        order = playlist.order_state() if snapshot.order_changed(playlist.round) else None
+        if not frames:
+            snapshot.save(state, order=order)
+            return
+        wanted = {}
+        for path in [current_path] + playlist.peek(WARM_START - 1):
+            if snapshot.frame(path) is not None:
+                wanted[path] = None
+                continue
+            ready = [current_img] if path == current_path else prefetcher.ready(path)
+            if ready is not None:
+                wanted[path] = frame_writer(ready[0])
+        snapshot.save(state, wanted, order)
+
+    while len(folder_index) == 0:
         print(f"No images found in {FOLDER}. Waiting...")
         time.sleep(5)
-        files = load_file_list()
-
-    index = 0
-    shown_count = 1
-    total_count = len(files)
-
-    current_img = load_image(str(files[index]))
+        added, _ = folder_index.poll(force=True)
+        catalog.sync([os.path.basename(p) for p in added], [])
+    playlist = load_playlist()
+    if saved.get("playlist"):
+        playlist.restore(saved["playlist"], snapshot.load(Snapshot.ORDER))
+    if pyramid is not None and playlist.current() != current_path:
+        # the image of the snapshot is gone
+        pyramid = None
+    # The first image, skipping those that cannot be read. When all of them
+    # failed, wait for the folder to change.
+    failed = set()
+    while pyramid is None:
+        path = playlist.next()
+        if path is None or path in failed:
+            print(f"No readable images in {FOLDER}. Waiting...")
+            time.sleep(5)
+            pygame.event.pump()
+            added, removed = folder_index.poll(force=True)
+            catalog.sync([os.path.basename(p) for p in added], [os.path.basename(p) for p in removed])
+            for p in added:
+                if p not in playlist:
+                    playlist.add(p)
+            for p in removed:
+                playlist.remove(p)
+            continue
+        try:
+            pyramid = fetch(path)
+            current_path = path
+        except Exception as e:
+            print(f"ERROR loading {path}: {e}")
+            failed.add(path)
+    current_img = pyramid[0]
+    prefetch()
     zoom_scale = 0.3
     target_scale = calc_target_scale(current_img)
     zoom_done_time = None
+    name = show_caption(current_path)
 
     clock = pygame.time.Clock()
     running = True
-    message = ""
     force_reload = False
     forward = False
+    backward = False
+    slides = 0
+
+    # The texts are rendered only when they change. While a still image is
+    # shown only their rectangles are updated, from a copy of the bare frame.
+    name_overlay = TextOverlay(font, lambda w, h: (20, 20))
+    counter_overlay = TextOverlay(font, lambda w, h: (sw - w - 20, sh - h - 20))
+    clock_overlay = TextOverlay(font, lambda w, h: (sw - w - 20, 20))
+    message_overlay = TextOverlay(font, lambda w, h: (20, sh - h - 20))
+    overlays = [name_overlay, message_overlay]
+    if show_remaining:
+        overlays.append(counter_overlay)
+    if show_time:
+        overlays.append(clock_overlay)
+    clock_minute = None
+    background = None
+
+    # Full frame rate only while zooming, during the hold the loop sleeps
+    # until the slide ends, the clock changes or an event arrives
+    scheduler = FrameScheduler(FRAME_RATES)
+    woken = []
 
     while running:
-        for event in pygame.event.get():
+        frame_start = time.perf_counter()
+        for event in woken + pygame.event.get():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                 running = False
             if event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
                 forward = True
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT:
+                forward = backward = True
             if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
                 force_reload = True
+            if event.type == COMMAND_EVENT:
+                command = event.command
+                if isinstance(command, SetMessage):
+                    message = command.text
+                    save_snapshot(frames=False)
+                elif isinstance(command, ResetMessage):
+                    message = ""
+                    save_snapshot(frames=False)
+                elif isinstance(command, Shuffle):
+                    force_reload = True  # force reload
+                elif isinstance(command, Next):
+                    forward = True
+                elif isinstance(command, Previous):
+                    forward = backward = True
+                elif isinstance(command, NewImage):
+                    # goes to the priority lane, shown right after the current one
+                    playlist.add(command.path)
+                    prefetch()
 
 
         if zoom_scale < target_scale and not forward:
@@ -316,65 +633,118 @@ def main():
         else:
             if forward or (zoom_done_time and pygame.time.get_ticks() - zoom_done_time > DELAY_AFTER_ZOOM):
                 forward = False
-                index += 1
-                shown_count += 1
-                if index >= len(files) or force_reload:
+                slides += 1
+                if MAX_SLIDES and slides >= MAX_SLIDES:
+                    running = False
+                if force_reload:
                     force_reload = False
-                    files = load_file_list()
-                    total_count = len(files)
-                    index = 0
-                    shown_count = 1
-                current_img = load_image(str(files[index]))
+                    playlist.reshuffle()
+                path = (playlist.prev() if backward else playlist.next()) or current_path
+                backward = False
+                try:
+                    # only waits if the prefetch is not done yet
+                    with metrics.timer("transition"):
+                        pyramid = fetch(path)
+                    current_path = path
+                except Exception as e:
+                    # keep showing the previous image
+                    print(f"ERROR loading {path}: {e}")
+                current_img = pyramid[0]
+                prefetch()
                 zoom_scale = 0.3
                 target_scale = calc_target_scale(current_img)
                 zoom_done_time = None
-
-        iw, ih = current_img.get_size()
-        new_size = (int(iw * zoom_scale), int(ih * zoom_scale))
-        scaled = pygame.transform.smoothscale(current_img, new_size)
-
-        x = (sw - new_size[0]) // 2
-        y = (sh - new_size[1]) // 2
-
-        screen.fill((0, 0, 0))
-        screen.blit(scaled, (x, y))
-        name = files[index].name
-        if name.startswith("unnamed_"):
-            name = ""
-        else:
-            name = name.split("_")[0]
-
-        filename_text = font.render(name, True, (255, 255, 255))
-        screen.blit(filename_text, (20, 20))
+                name = show_caption(current_path)
+                background = None
+                cache.save()
+                if raw_cache is not None:
+                    raw_cache.save()
+                save_snapshot()
+
+        # Images copied by hand join the next round, deleted ones are skipped
+        added, removed = folder_index.poll()
+        if added or removed:
+            catalog.sync([os.path.basename(p) for p in added], [os.path.basename(p) for p in removed])
+            for p in added:
+                if p not in playlist:
+                    playlist.add(p, priority=False)
+            for p in removed:
+                playlist.remove(p)
+            prefetch()
+
+        name_overlay.set_text(name)
         if show_remaining:
-            counter_text = font.render(f"{shown_count}/{total_count}", True, (255, 255, 255))
-            screen.blit(counter_text, (sw - counter_text.get_width() - 20, sh - counter_text.get_height() - 20))
-
+            counter_overlay.set_text(f"{playlist.shown}/{len(playlist)}")
         if show_time:
-            t = time.localtime()
-            current_time = time.strftime("%H:%M", t)
-            time_text = font.render(current_time, True, (255, 255, 255))
-            screen.blit(time_text, (sw - time_text.get_width() - 20, 20))
-
-        if queue.qsize() > 0:
-            fields = queue.get().split(" ")
-            command = fields[0]
-            text = " ".join(fields[1:])
-            if command == "/m":
-                message = text
-            elif command == "/reset":
-                message = ""
-            elif command == "/shuffle":
-                force_reload = True  # force reload
-
-        hola_text = font.render(message, True, (255, 255, 255))
-        hx = 20
-        hy = sh - hola_text.get_height() - 20
-        screen.blit(hola_text, (hx, hy))
-
-        pygame.display.flip()
-        clock.tick(hz)
-
+            # the clock text changes once a minute, not every frame
+            minute = int(time.time() // 60)
+            if minute != clock_minute:
+                clock_minute = minute
+                clock_overlay.set_text(time.strftime("%H:%M"))
+        message_overlay.set_text(message)
+
+        if zoom_done_time is None or background is None:
+            # Only the visible crop is resampled, at screen resolution
+            scaled, pos = render_zoom(pyramid, zoom_scale, (sw, sh))
+            screen.fill((0, 0, 0))
+            if scaled is not None:
+                screen.blit(scaled, pos)
+            if zoom_done_time is not None:
+                # the zoom is over, keep the bare image to refresh the texts on top of it
+                background = screen.copy()
+            for overlay in overlays:
+                overlay.draw(screen)
+            pygame.display.flip()
+            if not first_frame_shown:
+                first_frame_shown = True
+                metrics.observe("first_frame", (time.perf_counter() - STARTED) * 1000)
+        else:
+            # Holding a still image: only the texts that changed are redrawn
+            rects = []
+            for overlay in overlays:
+                if overlay.dirty:
+                    rects += overlay.redraw(screen, background)
+            if rects:
+                # restoring the background may have erased part of another text
+                for overlay in overlays:
+                    if overlay.drawn_rect is not None and overlay.drawn_rect.collidelist(rects) != -1:
+                        overlay.draw(screen)
+                pygame.display.update(rects)
+        metrics.observe("frame", (time.perf_counter() - frame_start) * 1000)
+        scheduler.frame()
+        metrics.count("frames")
+
+        woken = []
+        if zoom_done_time is None:
+            state = "zoom"
+            deadlines = []
+        else:
+            state = "hold"
+            hold_left = (zoom_done_time + DELAY_AFTER_ZOOM - pygame.time.get_ticks()) / 1000
+            deadlines = [time.monotonic() + hold_left, next_minute() if show_time else None]
+        delay = scheduler.delay_ms(state, deadlines)
+        if FRAME_RATES.get(state, 0):
+            clock.tick(FRAME_RATES[state])
+            # a frame taking more than this counts as dropped
+            if clock.get_time() > 1.5 * delay:
+                metrics.count("frames_dropped")
+        else:
+            event = pygame.event.wait(delay)
+            if event.type != pygame.NOEVENT:
+                woken = [event]
+            # the idle time must not count as zoom time
+            clock.tick()
+        metrics.gauge("fps", scheduler.rate())
+        metrics.gauge("frame_state", state)
+        metrics.dump()
+
+    save_snapshot()
+    snapshot.flush()
+    prefetcher.shutdown()
+    cache.save(force=True)
+    if raw_cache is not None:
+        raw_cache.save(force=True)
+    metrics.dump(force=True)
     pygame.quit()
 
 if __name__ == "__main__":
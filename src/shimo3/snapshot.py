@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class Snapshot:
+    """
+    What the display was showing, kept on disk so that after a restart the
+    last slide is back on screen before the folder is scanned and the bot
+    and the decoders are up: a JSON state (playlist position, message...)
+    plus prepared frames of the current and next images, ready to show.
+    Large parts that rarely change (the shuffled order of the playlist) go
+    to a file of their own, written only when they are given.
+
+    Frames are named after the source path and its modification time, a
+    modified image is not shown from an old frame. Everything is written in
+    a background thread, always to a temporary file first, so a crash leaves
+    the previous snapshot intact.
+    """
+
+    STATE = "state.json"
+    ORDER = "order.json"
+
+    def __init__(self, folder, ext=".jpg"):
+        self.folder = folder
+        self.ext = ext
+        os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        # latest state, order and frames not written yet, see save()
+        self.state = None
+        self.order = None
+        self.frames = {}
+        self.keep = set()
+        self.writer = None
+        # identifies the last order given to save()
+        self.order_key = None
+
+    def frame_path(self, path):
+        """Where the frame of image path is stored, None if path does not exist"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        name = hashlib.sha1(f"{path}:{mtime}".encode()).hexdigest()
+        return os.path.join(self.folder, name + self.ext)
+
+    def frame(self, path):
+        """Stored frame of image path, None if there is none"""
+        frame = self.frame_path(path)
+        if frame is None or not os.path.exists(frame):
+            return None
+        return frame
+
+    def order_changed(self, key):
+        """Whether the order identified by key (e.g. the playlist round) is not the last one saved"""
+        changed = key != self.order_key
+        self.order_key = key
+        return changed
+
+    def load(self, name=STATE):
+        """The last saved state (or order, with name=ORDER), {} if there is none"""
+        try:
+            with open(os.path.join(self.folder, name), "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def save(self, state, frames=None, order=None):
+        """
+        Replaces the snapshot with state (JSON-friendly) and the frames of
+        the images in frames, a dict of path to None if its frame is already
+        stored, or to write(tmp_path), called from the writer thread.
+        The frames no longer listed are removed. The order is only written
+        when given, before the state that refers to it.
+        """
+        with self.lock:
+            self.state = state
+            if order is not None:
+                self.order = order
+            if frames is not None:
+                self.keep = {self.frame_path(p) for p in frames}
+                self.frames.update((p, write) for p, write in frames.items() if write is not None)
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_pending, daemon=True, name="snapshot")
+                self.writer.start()
+
+    def write_pending(self):
+        while True:
+            with self.lock:
+                if self.state is None and self.order is None and not self.frames:
+                    self.writer = None
+                    return
+                state, self.state = self.state, None
+                order, self.order = self.order, None
+                frames, self.frames = self.frames, {}
+                keep = set(self.keep)
+            try:
+                self.write(state, order, frames, keep)
+            except Exception as e:
+                print(f"Snapshot not saved: {e}")
+
+    def write_json(self, name, data):
+        tmp = os.path.join(self.folder, name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, os.path.join(self.folder, name))
+
+    def write(self, state, order, frames, keep):
+        for path, write in frames.items():
+            frame = self.frame_path(path)
+            if frame is None or frame not in keep or os.path.exists(frame):
+                continue
+            tmp = frame[:-len(self.ext)] + ".tmp" + self.ext
+            write(tmp)
+            os.replace(tmp, frame)
+        if order is not None:
+            self.write_json(self.ORDER, order)
+        if state is not None:
+            self.write_json(self.STATE, state)
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(self.ext) and entry.path not in keep:
+                os.remove(entry.path)
+
+    def flush(self, timeout=5):
+        """Waits for the pending writes, call it before exiting"""
+        writer = self.writer
+        if writer is not None:
+            writer.join(timeout)
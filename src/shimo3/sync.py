@@ -0,0 +1,405 @@
+"""
+Fan-out of one ingest node (the bot) to many display nodes over the LAN.
+
+The bot process runs a SyncServer next to its image folder. Each display
+node runs a SyncClient that mirrors the folder into its own local folder,
+pulling only what changed since the catalog version it has, with the
+images resized for its resolution, and that forwards the commands
+published by the bot (to all nodes or to a group) to its display.
+
+The server only listens on localhost unless given another address, and
+then every request must carry the shared token (X-Sync-Token header):
+the images are private and the commands reach every screen.
+
+Try it on one machine:
+
+    python -m shimo3.sync serve ~/shimo --port 8765 --token secret
+    python -m shimo3.sync node http://localhost:8765 /tmp/node1 --size 800x600 --token secret
+    python -m shimo3.sync node http://localhost:8765 /tmp/node2 --size 1920x1080 --group kitchen --token secret
+    python -m shimo3.sync send http://localhost:8765 "/m hello" --group kitchen --token secret
+"""
+import argparse
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from shimo3.catalog import Catalog
+from shimo3.channel import NewImage, command_from_dict, command_to_dict, parse_command
+from shimo3.index import FolderIndex, is_image
+from shimo3.ingest import resize_to
+
+# how long a long-poll request is held open (s)
+POLL_TIMEOUT = 30
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def is_safe_name(filename):
+    """Whether filename is an image directly in the folder, not a path"""
+    return isinstance(filename, str) and os.path.basename(filename) == filename and is_image(filename)
+
+
+class SyncServer:
+    """
+    HTTP service over the image folder of the ingest node:
+
+        GET  /catalog?since=V&wait=S      changes after catalog version V
+        GET  /image/<filename>?w=W&h=H    the image resized to cover W x H
+        GET  /commands?since=N&group=G    commands after sequence number N
+        POST /commands                    {"text": "/m hi", "group": null}
+
+    The catalog and command requests wait up to POLL_TIMEOUT seconds for
+    something new, so nodes get images and commands as soon as they exist.
+    With a token, requests without it are refused; listening on anything
+    but localhost requires one.
+    """
+
+    def __init__(self, folder, port=8765, host="localhost", keep=100, token=None):
+        if host not in LOCAL_HOSTS and not token:
+            raise ValueError(f"A sync token is required to listen on {host or 'all interfaces'}")
+        self.folder = folder
+        self.token = token
+        self.catalog = Catalog(folder)
+        self.resized = os.path.join(folder, ".sync")
+        # last `keep` commands as (sequence number, group or None, command dict)
+        self.commands = []
+        self.keep = keep
+        self.seq = 0
+        self.cond = threading.Condition()
+
+        server = self
+
+        class Handler(SyncHandler):
+            sync = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True, name="sync-server").start()
+        print(f"Sync server listening on port {self.port}")
+
+    def stop(self):
+        self.httpd.shutdown()
+
+    def notify(self):
+        """Wakes up the nodes waiting for catalog changes, call it after ingesting"""
+        with self.cond:
+            self.cond.notify_all()
+
+    def publish(self, command, group=None):
+        """Sends command to all nodes, or only to those of group"""
+        with self.cond:
+            self.seq += 1
+            self.commands.append((self.seq, group, command_to_dict(command)))
+            del self.commands[:-self.keep]
+            self.cond.notify_all()
+
+    def changes(self, since, wait):
+        deadline = time.monotonic() + wait
+        while True:
+            version, changed, removed = self.catalog.changes(since)
+            left = deadline - time.monotonic()
+            if version != since or left <= 0:
+                break
+            with self.cond:
+                # other processes may write the catalog too, look again every second
+                self.cond.wait(min(left, 1.0))
+        # the bot records an image just before moving it into the folder, give
+        # it a moment so that it is not skipped; what never appears is left out
+        for _ in range(20):
+            if all(os.path.exists(os.path.join(self.folder, f)) for f, _ in changed):
+                break
+            time.sleep(0.1)
+        changed = [(f, c) for f, c in changed if os.path.exists(os.path.join(self.folder, f))]
+        return {"version": version, "changed": [{"filename": f, "caption": c} for f, c in changed],
+                "removed": removed}
+
+    def commands_since(self, since, group, wait):
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while True:
+                # a new node only gets the commands published from now on
+                if since < 0:
+                    return {"seq": self.seq, "commands": []}
+                pending = [c for s, g, c in self.commands if s > since and g in (None, group)]
+                left = deadline - time.monotonic()
+                if pending or left <= 0:
+                    return {"seq": self.seq, "commands": pending}
+                self.cond.wait(left)
+
+    def image(self, filename, size):
+        """Path of filename resized to cover size (cached), or of the original if it is small enough or cannot be resized"""
+        src = os.path.join(self.folder, filename)
+        if not size:
+            return src
+        w, h = size
+        dst = os.path.join(self.resized, f"{w}x{h}", filename)
+        if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+            return dst
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + f".{threading.get_ident()}.tmp.jpg"
+        try:
+            if resize_to(src, tmp, size) is None:
+                return src
+            os.replace(tmp, dst)
+        except Exception as e:
+            # corrupt, or a format pygame cannot convert here: the node gets
+            # the original and its display skips it if it cannot show it
+            print(f"Cannot resize {filename} for sync: {e}")
+            return src
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return dst
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    sync: SyncServer = None
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if not self.sync.token:
+            return True
+        token = self.headers.get("X-Sync-Token", "")
+        if hmac.compare_digest(token.encode(), self.sync.token.encode()):
+            return True
+        self.send_error(403)
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        url = urllib.parse.urlparse(self.path)
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+        try:
+            wait = max(0.0, min(float(query.get("wait", 0)), POLL_TIMEOUT))
+            since = int(query.get("since", 0 if url.path == "/catalog" else -1))
+            size = (int(query["w"]), int(query["h"])) if "w" in query and "h" in query else None
+        except ValueError:
+            self.send_error(400)
+            return
+        if size is not None and min(size) <= 0:
+            self.send_error(400)
+            return
+        if url.path == "/catalog":
+            self.send_json(self.sync.changes(since, wait))
+        elif url.path == "/commands":
+            self.send_json(self.sync.commands_since(since, query.get("group"), wait))
+        elif url.path.startswith("/image/"):
+            filename = urllib.parse.unquote(url.path[len("/image/"):])
+            # only images of the folder itself, no paths
+            if not is_safe_name(filename):
+                self.send_error(404)
+                return
+            try:
+                with open(self.sync.image(filename, size), "rb") as f:
+                    body = f.read()
+            except OSError:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path != "/commands":
+            self.send_error(404)
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            command = parse_command(str(data.get("text", "")))
+        except (ValueError, AttributeError):
+            self.send_error(400)
+            return
+        if command is None:
+            self.send_json({"error": "unknown command"}, 400)
+            return
+        self.sync.publish(command, data.get("group"))
+        self.send_json({"seq": self.sync.seq})
+
+    def log_message(self, format, *args):
+        # one line per long-poll would flood the output
+        pass
+
+
+class SyncClient:
+    """
+    Display side of the fan-out. Keeps `folder` (and its catalog) a copy of
+    the server's, with images resized to cover `size`, and sends the
+    commands for this node to channel, plus NewImage for each new image so
+    that it is shown next. Without a channel the commands are printed.
+    """
+
+    def __init__(self, url, folder, size=None, channel=None, group=None, token=None):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.folder = folder
+        self.size = tuple(size) if size else None
+        self.channel = channel
+        self.group = group
+        self.catalog = Catalog(folder)
+        self.staging = os.path.join(folder, ".incoming")
+        os.makedirs(self.staging, exist_ok=True)
+        # the catalog version we are in sync with, kept across restarts
+        self.version_file = os.path.join(folder, ".sync_version")
+        try:
+            with open(self.version_file) as f:
+                self.version = int(f.read())
+        except (OSError, ValueError):
+            self.version = 0
+
+    def start(self):
+        threading.Thread(target=self.run, args=(self.sync_images,), daemon=True, name="sync-images").start()
+        threading.Thread(target=self.run, args=(self.sync_commands,), daemon=True, name="sync-commands").start()
+
+    def run(self, step):
+        while True:
+            try:
+                step()
+            except Exception as e:
+                print(f"Sync with {self.url} failed: {e}")
+                time.sleep(5)
+
+    def get(self, path, **query):
+        url = f"{self.url}{path}?{urllib.parse.urlencode(query)}"
+        headers = {"X-Sync-Token": self.token} if self.token else {}
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=POLL_TIMEOUT + 30) as response:
+            return response.read()
+
+    def send(self, command):
+        if self.channel is not None:
+            self.channel.send(command)
+        else:
+            print(f"Command: {command}")
+
+    def sync_images(self):
+        data = json.loads(self.get("/catalog", since=self.version, wait=POLL_TIMEOUT))
+        # a full list: anything not in it is gone
+        full = data["removed"] is None
+        if full:
+            data["removed"] = list(set(self.catalog.filenames()) - {c["filename"] for c in data["changed"]})
+
+        for change in data["changed"]:
+            filename = change["filename"]
+            if not is_safe_name(filename):
+                # a path would write outside the folder
+                print(f"Sync: ignoring invalid filename {filename!r}")
+                continue
+            final = os.path.join(self.folder, filename)
+            if os.path.exists(final):
+                self.catalog.add(filename, caption=change["caption"])
+                continue
+            query = {"w": self.size[0], "h": self.size[1]} if self.size else {}
+            part = os.path.join(self.staging, filename + ".part")
+            try:
+                body = self.get("/image/" + urllib.parse.quote(filename), **query)
+            except urllib.error.HTTPError as e:
+                # one bad file must not hold back the rest, it is skipped
+                print(f"Sync of {filename} failed, skipping it: {e}")
+                continue
+            with open(part, "wb") as f:
+                f.write(body)
+            # same order as the bot: catalog first, then the file appears
+            self.catalog.add(filename, caption=change["caption"])
+            os.replace(part, final)
+            if not full:
+                self.send(NewImage(final))
+            print(f"Synced {filename}")
+
+        for filename in data["removed"]:
+            if not is_safe_name(filename):
+                print(f"Sync: ignoring invalid filename {filename!r}")
+                continue
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except FileNotFoundError:
+                pass
+            self.catalog.remove(filename)
+
+        self.version = data["version"]
+        with open(self.version_file + ".tmp", "w") as f:
+            f.write(str(self.version))
+        os.replace(self.version_file + ".tmp", self.version_file)
+
+    def sync_commands(self):
+        since = -1
+        while True:
+            query = {"since": since, "wait": POLL_TIMEOUT}
+            if self.group:
+                query["group"] = self.group
+            data = json.loads(self.get("/commands", **query))
+            for command in data["commands"]:
+                self.send(command_from_dict(command))
+            since = data["seq"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image and command fan-out to several slideshow nodes")
+    sub = parser.add_subparsers(dest="action", required=True)
+    serve = sub.add_parser("serve", help="serve an image folder")
+    serve.add_argument("folder")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--host", default="localhost", help="address to listen on, e.g. 0.0.0.0 (needs --token)")
+    node = sub.add_parser("node", help="mirror a server into a folder and print its commands")
+    node.add_argument("url")
+    node.add_argument("folder")
+    node.add_argument("--size", default=None, help="node resolution, e.g. 1920x1080")
+    node.add_argument("--group", default=None)
+    send = sub.add_parser("send", help="send a command (/m text, /reset, /shuffle, /next, /prev) to the nodes")
+    send.add_argument("url")
+    send.add_argument("text")
+    send.add_argument("--group", default=None)
+    for command in (serve, node, send):
+        command.add_argument("--token", default=None, help="shared secret of the server and its nodes")
+    args = parser.parse_args()
+
+    if args.action == "serve":
+        server = SyncServer(os.path.expanduser(args.folder), args.port, args.host, token=args.token)
+        # images copied into the folder by hand are served too
+        index = FolderIndex(server.folder)
+        server.catalog.sync_all(os.path.basename(p) for p in index.files())
+        server.start()
+        while True:
+            time.sleep(1)
+            added, removed = index.poll()
+            if added or removed:
+                server.catalog.sync([os.path.basename(p) for p in added], [os.path.basename(p) for p in removed])
+                server.notify()
+    elif args.action == "node":
+        size = tuple(int(v) for v in args.size.split("x")) if args.size else None
+        SyncClient(args.url, os.path.expanduser(args.folder), size, group=args.group, token=args.token).start()
+        while True:
+            time.sleep(1)
+    else:
+        headers = {"Content-Type": "application/json"}
+        if args.token:
+            headers["X-Sync-Token"] = args.token
+        request = urllib.request.Request(args.url.rstrip("/") + "/commands",
+                                         json.dumps({"text": args.text, "group": args.group}).encode(), headers)
+        with urllib.request.urlopen(request) as response:
+            print(response.read().decode())
+
+
+if __name__ == "__main__":
+    main()
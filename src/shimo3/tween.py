@@ -0,0 +1,45 @@
+import time
+
+
+def linear(t):
+    return t
+
+
+def ease_in_out(t):
+    # cubic, slow at both ends
+    return 4 * t * t * t if t < 0.5 else 1 - (-2 * t + 2) ** 3 / 2
+
+
+def ease_out(t):
+    # cubic, fast start and gentle stop
+    return 1 - (1 - t) ** 3
+
+
+EASINGS = {"linear": linear, "ease_in_out": ease_in_out, "ease_out": ease_out}
+
+
+class Tween:
+    """
+    A value going from start to end in `duration` seconds of monotonic time,
+    following an easing curve. The value depends only on the elapsed time, so
+    late or missed frames make an animation less smooth but not longer.
+    """
+
+    def __init__(self, start, end, duration, easing=linear):
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.easing = EASINGS[easing] if isinstance(easing, str) else easing
+        self.started = time.monotonic()
+
+    def progress(self):
+        """Fraction of the duration elapsed, from 0 to 1"""
+        if self.duration <= 0:
+            return 1.0
+        return min(1.0, (time.monotonic() - self.started) / self.duration)
+
+    def value(self):
+        return self.start + (self.end - self.start) * self.easing(self.progress())
+
+    def done(self):
+        return self.progress() >= 1.0
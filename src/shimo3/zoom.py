@@ -0,0 +1,68 @@
+import math
+
+import pygame
+
+
+def build_pyramid(img, min_size=64):
+    """
+    Returns the resolution pyramid of img: img itself followed by copies
+    halved in size until one side would be smaller than min_size.
+    """
+    levels = [img]
+    w, h = img.get_size()
+    while w // 2 >= min_size and h // 2 >= min_size:
+        w, h = w // 2, h // 2
+        levels.append(pygame.transform.smoothscale(levels[-1], (w, h)))
+    return levels
+
+
+def render_zoom(pyramid, scale, screen_size):
+    """
+    Renders the image zoomed by scale and centered on a screen of screen_size.
+    Only the part of the image that ends on screen is resampled, and it is
+    taken from the smallest pyramid level that still has enough pixels, so
+    the cost depends on the screen size and not on the image size.
+    Returns (surface, position) to blit, or (None, None) if nothing is visible.
+    """
+    sw, sh = screen_size
+    iw, ih = pyramid[0].get_size()
+    dw, dh = iw * scale, ih * scale
+
+    # Where the whole zoomed image would be placed on screen
+    x0 = (sw - dw) / 2
+    y0 = (sh - dh) / 2
+
+    # Visible part of it, in screen coordinates
+    vx0, vy0 = max(0.0, x0), max(0.0, y0)
+    vx1, vy1 = min(sw, x0 + dw), min(sh, y0 + dh)
+    if vx1 <= vx0 or vy1 <= vy0:
+        return None, None
+
+    # Smallest level that is not smaller than what is shown
+    level = pyramid[0]
+    for candidate in pyramid[1:]:
+        if candidate.get_width() < dw:
+            break
+        level = candidate
+    lw, lh = level.get_size()
+
+    # Screen pixels -> level pixels
+    fx = lw / dw
+    fy = lh / dh
+
+    # Visible rectangle in level coordinates, widened to whole pixels
+    sx0 = max(0, math.floor((vx0 - x0) * fx))
+    sy0 = max(0, math.floor((vy0 - y0) * fy))
+    sx1 = min(lw, math.ceil((vx1 - x0) * fx))
+    sy1 = min(lh, math.ceil((vy1 - y0) * fy))
+    if sx1 <= sx0 or sy1 <= sy0:
+        return None, None
+
+    # Place the crop exactly where its pixels fall, it may overflow the
+    # screen by less than a source pixel and the blit clips it.
+    px = x0 + sx0 / fx
+    py = y0 + sy0 / fy
+    size = (max(1, round((sx1 - sx0) / fx)), max(1, round((sy1 - sy0) / fy)))
+
+    crop = level.subsurface(pygame.Rect(sx0, sy0, sx1 - sx0, sy1 - sy0))
+    return pygame.transform.smoothscale(crop, size), (round(px), round(py))
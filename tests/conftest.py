@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the package lives in src/, run the tests without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
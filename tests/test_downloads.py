@@ -0,0 +1,22 @@
+import asyncio
+from types import SimpleNamespace
+
+from shimo3.chats import burst_summary
+from shimo3.downloads import Downloader
+
+
+def test_timeout_reply_says_why(tmp_path):
+    async def get_file():
+        await asyncio.sleep(10)
+
+    async def download():
+        await Downloader(timeout=0.05).download(SimpleNamespace(get_file=get_file), str(tmp_path / "a.jpg"))
+
+    try:
+        asyncio.run(download())
+    except TimeoutError as e:
+        error = e
+    else:
+        raise AssertionError("the download did not time out")
+
+    assert burst_summary([("a.jpg", error)]) == "❌ Failed to save photo: download timed out after 0.05s"
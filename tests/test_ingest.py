@@ -0,0 +1,57 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from shimo3.dedup import AlreadyKnown, DedupIndex
+from shimo3.ingest import Ingestor
+
+
+class FakeDownloader:
+    metrics = None
+
+    async def download(self, photo, path):
+        # both downloads are in flight at the same time
+        await asyncio.sleep(0.05)
+        with open(path, "wb") as f:
+            f.write(photo.content)
+
+
+def photo(unique_id, content=b"same picture"):
+    return SimpleNamespace(file_unique_id=unique_id, content=content, width=10, height=10)
+
+
+def ingest_all(folder, jobs):
+    # with a display size the resize runs in the process pool, the ingests
+    # interleave there too (the fake photos cannot be resized, they are kept)
+    ingestor = Ingestor(str(folder), FakeDownloader(), size=(10, 10), workers=1, dedup=DedupIndex(str(folder)))
+    try:
+        return asyncio.run(ingestor.ingest_all(jobs))
+    finally:
+        ingestor.pool.shutdown()
+
+
+def test_same_photo_twice_at_once_is_saved_once(tmp_path):
+    results = ingest_all(tmp_path, [(photo("u1"), "a_1.jpg", {}), (photo("u1"), "b_2.jpg", {})])
+    assert results[0] == os.path.join(str(tmp_path), "a_1.jpg")
+    assert isinstance(results[1], AlreadyKnown) and results[1].args[0] == "a_1.jpg"
+    assert not (tmp_path / "b_2.jpg").exists()
+
+
+def test_same_content_twice_at_once_is_saved_once(tmp_path):
+    # forwarded copies: other file_unique_id, same bytes
+    results = ingest_all(tmp_path, [(photo("u1"), "a_1.jpg", {}), (photo("u2"), "b_2.jpg", {})])
+    assert sum(isinstance(r, AlreadyKnown) for r in results) == 1
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".jpg")]) == 1
+
+
+def test_failed_ingest_releases_its_claim(tmp_path):
+    dedup = DedupIndex(str(tmp_path))
+
+    class Failing(FakeDownloader):
+        async def download(self, photo, path):
+            raise OSError("network down")
+
+    results = asyncio.run(Ingestor(str(tmp_path), Failing(), dedup=dedup).ingest_all([(photo("u1"), "a_1.jpg", {})]))
+    assert isinstance(results[0], OSError)
+    results = asyncio.run(Ingestor(str(tmp_path), FakeDownloader(), dedup=dedup).ingest_all([(photo("u1"), "a_1.jpg", {})]))
+    assert results[0] == os.path.join(str(tmp_path), "a_1.jpg")
@@ -0,0 +1,51 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from shimo3.sync import SyncClient
+
+
+def fake_server(catalog):
+    """Server answering /catalog with `catalog` and any /image/ with some bytes"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(catalog).encode() if self.path.startswith("/catalog") else b"image"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("localhost", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def test_client_ignores_paths_from_the_server(tmp_path):
+    folder = tmp_path / "node"
+    victim = tmp_path / "victim"
+    victim.mkdir()
+    (victim / "keep.jpg").write_bytes(b"mine")
+    evil = [str(victim / "abs.jpg"), "../victim/rel.jpg", "../victim/evil.txt", "sub/x.jpg"]
+    httpd = fake_server({
+        "version": 5,
+        "changed": [{"filename": f, "caption": ""} for f in evil] + [{"filename": "ok.jpg", "caption": ""}],
+        "removed": [str(victim / "keep.jpg"), "../victim/keep.jpg"],
+    })
+    try:
+        sent = []
+        client = SyncClient(f"http://localhost:{httpd.server_address[1]}", str(folder))
+        client.send = sent.append
+        client.sync_images()
+    finally:
+        httpd.shutdown()
+
+    assert sorted(os.listdir(victim)) == ["keep.jpg"]
+    assert (folder / "ok.jpg").read_bytes() == b"image"
+    assert not (folder / "sub").exists()
+    assert [os.path.basename(c.path) for c in sent] == ["ok.jpg"]
+    assert client.version == 5
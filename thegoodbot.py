@@ -1,10 +1,20 @@
 BOT_TOKEN = ""
 import os
 import re
-import asyncio
+import threading
 from telegram import Update, Bot
 from telegram.ext import Application, ContextTypes, MessageHandler, filters
 
+from shimo3.albums import AlbumAssembler
+from shimo3.catalog import Catalog, message_info
+from shimo3.chats import ChatOrder, ReplyCoalescer, burst_summary
+from shimo3.channel import NewImage, parse_command
+from shimo3.dedup import AlreadyKnown, DedupIndex
+from shimo3.downloads import Downloader
+from shimo3.ingest import Ingestor
+from shimo3.metrics import Metrics, load, summary
+from shimo3.sync import SyncServer
+
 # --- Global state ---
 
 def sanitize_filename(text: str) -> str:
@@ -14,7 +24,7 @@ def sanitize_filename(text: str) -> str:
     return text[:50] if text else "unnamed_media"
 
 
-def run_bot(queue, config):
+def run_bot(channel, config):
     """Entry point."""
     token = config.get("bot_token", None)
 
@@ -24,50 +34,98 @@ def run_bot(queue, config):
 
     save_dir = config.get("save_dir", "downloads")
     authorized_users = config.get("authorized_users", [])
+    stats_file = config.get("stats_file", None)
 
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
 
-    media_groups = {}
-
     builder = Application.builder()
     builder.token(token)
-    builder.concurrent_updates(False)
+    # the updates of different chats are handled concurrently, those of
+    # the same chat one after the other, see ChatOrder
+    builder.concurrent_updates(True)
 
     # Manually set job_queue to None before building
     builder._job_queue = None
 
     app = builder.build()
 
-    async def process_media_group_delayed(chat_id: int, group_id: str, safe_name) -> None:
-        """Process media group after delay using global bot reference."""
-        await asyncio.sleep(1.0)
-
-        group_data = media_groups.pop((chat_id, group_id), None)
-        if not group_data:
-            return
-
-        buf = group_data.get('messages', [])
-        if not buf:
-            return
+    # Download statistics, reported by /stats together with the display ones
+    metrics = Metrics()
+    downloader = Downloader(config.get("download_concurrency", 4), config.get("download_timeout", 30), metrics)
+    # photos already in the library are not downloaded again
+    dedup = DedupIndex(save_dir)
+    # downloads are staged, resized to display_size and renamed into save_dir atomically
+    ingestor = Ingestor(save_dir, downloader, config.get("display_size", None), config.get("ingest_workers", 2), dedup,
+                        Catalog(save_dir))
+
+    # other screens pull the images and commands from here, see shimo3.sync
+    sync = SyncServer(save_dir, config["sync_port"], config.get("sync_host", "localhost"),
+                      token=config.get("sync_token", None)) if config.get("sync_port") else None
+    if sync:
+        sync.start()
+
+    def image_added(path):
+        channel.send(NewImage(path))
+        if sync:
+            sync.notify()
+
+    def send_command(command, group=None):
+        # the local screen is part of sync_group
+        if group is None or group == config.get("sync_group"):
+            channel.send(command)
+        if sync:
+            sync.publish(command, group)
+
+    async def process_media_group(key, buf, caption, late) -> None:
+        """Process a media group (or its late parts) once the assembler flushes it."""
+        chat_id, group_id = key
+        safe_name = sanitize_filename(caption or "unnamed")
 
         saved_count = 0
-
-        for msg, file, safe_name_base in buf:
-            try:
-                filename = f"{safe_name}_{msg.message_id}.jpg"
-                path = os.path.join(save_dir, filename)
-                await file.download_to_drive(path)
+        known_count = 0
+
+        jobs = [(photo, f"{safe_name}_{msg.message_id}.jpg", message_info(msg, caption)) for msg, photo in buf]
+        results = await ingestor.ingest_all(jobs)
+        for (msg, _), (_, filename, _), result in zip(buf, jobs, results):
+            if isinstance(result, AlreadyKnown):
+                known_count += 1
+            elif isinstance(result, BaseException):
+                print(f"ERROR downloading file {msg.message_id}: {result!r}")
+            else:
                 saved_count += 1
+                image_added(result)
                 print(f"Successfully downloaded: {filename}")
-            except Exception as e:
-                print(f"ERROR downloading file {msg.message_id}: {e}")
 
         try:
-            await app.bot.send_message(chat_id, f"✅ Saved {saved_count} photos from media group.")
+            if late:
+                text = f"✅ Saved {saved_count} more photos to the media group."
+            else:
+                text = f"✅ Saved {saved_count} photos from media group."
+            if known_count:
+                text += f" {known_count} were already in the library."
+            await app.bot.send_message(chat_id, text)
+        except Exception as e:
+            print(f"ERROR sending confirmation: {e}")
+
+    # albums are flushed as soon as they are complete, see AlbumAssembler
+    albums = AlbumAssembler(process_media_group, config.get("album_quiet", 0.4), config.get("album_cap", 3.0))
+
+    async def save_photo(photo, filename, info):
+        path = await ingestor.ingest(photo, filename, **info)
+        image_added(path)
+        return path
+
+    async def confirm_photos(chat_id, results):
+        try:
+            await app.bot.send_message(chat_id, burst_summary(results))
         except Exception as e:
             print(f"ERROR sending confirmation: {e}")
 
+    # single photos are confirmed with one reply per burst
+    replies = ReplyCoalescer(confirm_photos, config.get("reply_quiet", 2.0))
+    in_order = ChatOrder()
+
     async def handle_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """
         Handles incoming commands.
@@ -89,11 +147,21 @@ def run_bot(queue, config):
                 "/m <message> - Set a message to display on screen\n"
                 "/reset - Clear the screen message\n"
                 "/shuffle - Shuffle the image order\n"
+                "/next, /prev - Go to the next or the previous image\n"
+                "/to <group> <command> - Send a command to a group of screens\n"
+                "/stats - Show performance statistics\n"
                 "/help - Show this help message",
                 parse_mode='Markdown'
             )
-        elif command.split(" ")[0] in ["/m", "/reset", "/shuffle"]:
-            queue.put(command)
+        elif command == "/stats":
+            display = load(stats_file) if stats_file else None
+            await msg.reply_text(summary(display, "Display") + "\n\n" + summary(metrics.snapshot(), "Bot"))
+        elif command.startswith("/to ") and parse_command(command.split(" ", 2)[-1]) is not None:
+            _, group, text = command.split(" ", 2)
+            send_command(parse_command(text), group)
+            await msg.reply_text(f"OK!")
+        elif parse_command(command) is not None:
+            send_command(parse_command(command))
             await msg.reply_text(f"OK!")
         else:
             await msg.reply_text(f"❓ Unknown command: {command}")
@@ -111,32 +179,23 @@ def run_bot(queue, config):
 
         safe_name_base = sanitize_filename(caption)
 
-        file = await msg.photo[-1].get_file()
+        # the file is fetched when downloading, together with the rest of the album
+        photo = msg.photo[-1]
 
         if group_id:
-            key = (msg.chat_id, group_id)
-
-            if key not in media_groups:
-                media_groups[key] = {'messages': []}
-                asyncio.create_task(process_media_group_delayed(msg.chat_id, group_id, safe_name_base))
-
-            media_groups[key]['messages'].append((msg, file, safe_name_base))
+            albums.add((msg.chat_id, group_id), (msg, photo), msg.caption)
         else:
             filename = f"{safe_name_base}_{msg.message_id}.jpg"
-            path = os.path.join(save_dir, filename)
-
-            try:
-                await file.download_to_drive(path)
-                await msg.reply_text(f"✅ Saved single photo as `{filename}`", parse_mode='Markdown')
-            except Exception as e:
-                await msg.reply_text(f"❌ Failed to save photo: {e}")
+            # downloaded while the next updates of the chat are handled
+            replies.add(msg.chat_id, filename, save_photo(photo, filename, message_info(msg)))
 
-        queue.put(f"/shuffle") # forces shuffling when a photo is received
 
+    # index the files that were copied into the folder by other means
+    threading.Thread(target=dedup.import_folder, daemon=True).start()
 
     # Add handler
-    app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-    app.add_handler(MessageHandler(filters.COMMAND, handle_command))
+    app.add_handler(MessageHandler(filters.PHOTO, in_order.wrap(handle_photo)))
+    app.add_handler(MessageHandler(filters.COMMAND, in_order.wrap(handle_command)))
 
     print("🤖 Bot is starting... Press Ctrl+C to stop.")
 
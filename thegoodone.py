@@ -1,19 +1,147 @@
-import glob
 import multiprocessing
-import random
 import sys
 import time
-from multiprocessing import Queue
+
+# close enough to the process start, for the time to first frame
+STARTED = time.perf_counter()
+
 from os import path
 import os
-from random import shuffle
 
 import yaml
-from PyQt5.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QGraphicsTextItem, QGraphicsPixmapItem
-from PyQt5.QtGui import QPixmap, QPainter, QFont, QColor
-from PyQt5.QtCore import Qt, QTimer, QRect
+from PyQt5.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem
+from PyQt5.QtGui import QPixmap, QPainter, QFont, QColor, QImage, QImageReader, QImageIOHandler, QFontMetrics
+from PyQt5.QtCore import Qt, QTimer, QRect, QRectF, QSocketNotifier, QObject, QRunnable, QThreadPool, QSize, pyqtSignal
+from PyQt5 import sip
+
+from shimo3.cache import MemoryCache, RawCache
+from shimo3.catalog import Catalog
+from shimo3.channel import CommandChannel, NewImage, Next, Previous, ResetMessage, SetMessage, Shuffle
+from shimo3.index import FolderIndex
+from shimo3.metrics import Metrics
+from shimo3.playlist import Playlist
+from shimo3.scheduler import FrameScheduler, next_minute
+from shimo3.snapshot import Snapshot
+from shimo3.sync import SyncClient
+from shimo3.tween import Tween
+
+# QImage formats of the raw cache pixel formats
+RAW_FORMATS = {"RGBX": QImage.Format_RGBX8888, "RGBA": QImage.Format_RGBA8888}
+
+
+def start_bot(channel, config):
+    # imported in the bot process only, telegram takes a while to import
+    from thegoodbot import run_bot
+    run_bot(channel, config)
+
+
+class LoadSignals(QObject):
+    # filename, decoded image (null if it could not be read) and the memory
+    # it uses when it comes from the raw cache, to keep it alive
+    loaded = pyqtSignal(str, QImage, object)
+
+
+class LoadJob(QRunnable):
+    """
+    Decodes an image in the thread pool, directly at the largest size the
+    zoom will show it in a viewport of `viewport` size, never larger than the
+    original. Only QImage can be used outside the GUI thread, it is turned
+    into a QPixmap when the image is shown.
+    With a RawCache the decoded pixels are stored there, and next time the
+    image wraps the mapped file instead of being decoded.
+    """
+
+    def __init__(self, filename, viewport, signals, metrics, raw_cache=None):
+        super().__init__()
+        self.filename = filename
+        self.viewport = viewport
+        self.signals = signals
+        self.metrics = metrics
+        self.raw_cache = raw_cache
+
+    def run(self):
+        key = None
+        if self.raw_cache is not None:
+            key = self.raw_cache.key(self.filename, (self.viewport.width(), self.viewport.height()))
+            raw = self.raw_cache.load_levels(key)
+            if raw is not None and raw[0] in RAW_FORMATS:
+                fmt, levels = raw
+                (w, h), pitch, pixels = levels[0]
+                self.metrics.count("raw_hits")
+                self.signals.loaded.emit(self.filename, QImage(sip.voidptr(pixels), w, h, pitch, RAW_FORMATS[fmt]),
+                                         pixels)
+                return
+            self.metrics.count("raw_misses")
+
+        with self.metrics.timer("decode"):
+            reader = QImageReader(self.filename)
+            # EXIF orientation, phones store most photos rotated
+            reader.setAutoTransform(True)
+            size = reader.size()
+            if size.isValid() and size.width() and size.height():
+                vw, vh = self.viewport.width(), self.viewport.height()
+                if reader.transformation() & QImageIOHandler.TransformationRotate90:
+                    # the scaled size applies to the stored, not yet rotated, pixels
+                    vw, vh = vh, vw
+                # the zoom ends with the image covering the viewport. For
+                # JPEGs the reader decodes directly at a reduced scale.
+                cover = max(vw / size.width(), vh / size.height())
+                if cover < 1:
+                    reader.setScaledSize(QSize(round(size.width() * cover), round(size.height() * cover)))
+            image = reader.read()
+        if image.isNull():
+            print(f"ERROR loading {self.filename}: {reader.errorString()}")
+        elif key is not None:
+            fmt = "RGBA" if image.hasAlphaChannel() else "RGBX"
+            raw = image.convertToFormat(RAW_FORMATS[fmt])
+            self.raw_cache.store_levels(key, fmt, [((raw.width(), raw.height()), raw.bytesPerLine(),
+                                                    raw.constBits().asstring(raw.sizeInBytes()))])
+        self.signals.loaded.emit(self.filename, image, None)
+
+
+class OverlayText:
+    """
+    Text drawn over the view, outside of the zoomed scene. It is rendered to
+    a pixmap only when it changes and placed in a corner of the viewport
+    (`corner` is a combination of Qt.AlignTop/AlignBottom and AlignLeft/AlignRight).
+    """
+
+    MARGIN = 10
+
+    def __init__(self, font, corner, color=QColor(255, 255, 255)):
+        self.font = font
+        self.corner = corner
+        self.color = color
+        self.text = ""
+        self.pixmap = None
+
+    def set_text(self, text):
+        """Returns whether the text changed"""
+        if text == self.text:
+            return False
+        self.text = text
+        self.pixmap = None
+        if text:
+            flags = int(self.corner & (Qt.AlignLeft | Qt.AlignRight))
+            size = QFontMetrics(self.font).boundingRect(QRect(0, 0, 100000, 100000), flags, text).size()
+            self.pixmap = QPixmap(size)
+            self.pixmap.fill(Qt.transparent)
+            painter = QPainter(self.pixmap)
+            painter.setFont(self.font)
+            painter.setPen(self.color)
+            painter.drawText(QRect(0, 0, size.width(), size.height()), flags, text)
+            painter.end()
+        return True
+
+    def rect(self, viewport):
+        """Where it goes in a viewport of QSize viewport"""
+        if self.pixmap is None:
+            return QRect()
+        w, h = self.pixmap.width(), self.pixmap.height()
+        x = viewport.width() - w - self.MARGIN if self.corner & Qt.AlignRight else self.MARGIN
+        y = viewport.height() - h - self.MARGIN if self.corner & Qt.AlignBottom else self.MARGIN
+        return QRect(x, y, w, h)
 
-from thegoodbot import run_bot
 
 class GrowingView(QGraphicsView):
     CHOOSE = 0
@@ -22,51 +150,102 @@ class GrowingView(QGraphicsView):
     FADING = 3
     BRIGHTENING = 4
 
-    def __init__(self, q, config):
+    STATE_NAMES = {CHOOSE: "choose", GROWING: "growing", SHOWING: "showing", FADING: "fading",
+                   BRIGHTENING: "brightening"}
+
+    def __init__(self, channel, config):
         super().__init__()
         self.ts = 0
-        self.queue: Queue = q
+        self.channel: CommandChannel = channel
         self.state = GrowingView.GROWING
         self.scale_factor = 0.1
         self.delta = config.get("scale_delta", 0.01)
-        self.images = []
         self.timer = QTimer(self)
         self.timer.setInterval(config.get("rate", 30))
         self.timer.timeout.connect(self.grow)
+        # the timer runs at full rate only while something moves, when the
+        # image is still it fires at the next deadline (slide end, clock)
+        rates = {name: 1000 / config.get("rate", 30) for name in GrowingView.STATE_NAMES.values()}
+        rates.update({"showing": 0, "waiting": 0, "loading": 0})
+        rates.update(config.get("frame_rates", {}))
+        self.scheduler = FrameScheduler(rates)
+
+        # Tick and per-state timing, see /stats
+        self.metrics = Metrics(config.get("stats_file", None))
+        self.state_ts = time.monotonic()
+        self.tick_ts = None
+        # interval the scheduler chose for the next tick, None after a wake-up
+        self.tick_interval = None
         self.landscape = True
         self.save_dir = config.get("save_dir", "downloads")
+        # the folder is scanned by open_library(), once the view is shown
+        self.index = None
+        self.catalog = None
+        self.playlist = None
+        self.waiting = False
+
+        # The next images are decoded in background threads, CHOOSE only
+        # takes an image that is ready and otherwise waits without blocking
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(config.get("load_workers", 2))
+        self.prefetch_depth = config.get("prefetch", 2)
+        self.load_signals = LoadSignals()
+        self.load_signals.loaded.connect(self.image_loaded)
+        # Key: filename
+        # Value: (decoded QImage, raw cache memory it uses or None)
+        self.ready = {}
+        self.loading = set()
+        # image picked by CHOOSE, shown as soon as it is decoded
+        self.upcoming = None
+        # the last images shown stay as pixmaps, going back to them is instant
+        self.pixmaps = MemoryCache(config.get("pixmap_cache", 256) * 1024 * 1024)
+        # decoded pixels on disk, for the images shown over and over (MB, 0 disables it)
+        raw_cache = config.get("raw_cache", 0)
+        cache_folder = path.expanduser(config.get("cache_folder", "~/.cache/thegoodone"))
+        self.raw_cache = RawCache(path.join(cache_folder, "raw"), raw_cache * 1024 * 1024) if raw_cache else None
+        self.going_back = False
+        # what was on screen, to start from there after a restart
+        # frames kept for the next start, the current one and the next ones (0 disables it)
+        self.warm_start = config.get("warm_start", 3)
+        self.snapshot = Snapshot(path.join(cache_folder, "snapshot"))
+        self.saved = self.snapshot.load() if self.warm_start else {}
+        # image of the snapshot on screen before the library is open
+        self.warm = None
+        self.first_frame_shown = False
+
         scene = QGraphicsScene()
         self.pixmap = scene.addPixmap(QPixmap())
         self.fading_speed = config.get("fading_speed", 0.02)
+        # The animations follow the clock, not the timer ticks. By default they
+        # last what the per-tick speeds used to give at the nominal rate.
+        ticks_per_second = 1000 / config.get("rate", 30)
+        self.fade_time = config.get("fade_time", 1 / (self.fading_speed * ticks_per_second) if self.fading_speed else 0)
+        self.grow_speed = self.delta * ticks_per_second  # scale per second
+        self.grow_time = config.get("grow_time", None)  # fixed growth duration (s), overrides grow_speed
+        self.easing = config.get("easing", "ease_out")
+        self.tween = None
         self.show_remaining = config.get("show_remaining", False)
 
-        # Create text item
-        self.text_item = QGraphicsTextItem("")
-        self.text_item.setDefaultTextColor(QColor(255, 255, 255))  # White color
+        # The texts are not part of the scene, they are drawn on top of it in
+        # drawForeground() and repainted only when they change
         font = QFont("Arial", config.get("font_size", 32), QFont.Bold)
-        self.text_item.setFont(font)
-
-        self.clock_item = QGraphicsTextItem("")
-        self.clock_item.setDefaultTextColor(QColor(255, 255, 255))  # White color
-        self.clock_item.setFont(font)
-
-        self.info_item = QGraphicsTextItem("")
-        self.info_item.setDefaultTextColor(QColor(255, 255, 255))  # White color
-        self.info_item.setFont(font)
+        self.caption_text = OverlayText(font, Qt.AlignTop | Qt.AlignLeft)
+        self.clock_text = OverlayText(font, Qt.AlignTop | Qt.AlignRight)
+        self.info_text = OverlayText(font, Qt.AlignBottom | Qt.AlignLeft)
+        self.overlays = [self.caption_text, self.clock_text, self.info_text]
+        self.info_text.set_text(self.saved.get("message", ""))
 
         self.duration = config.get("duration", 1)
+        # quit after this many slides, used by the benchmarks
+        self.max_slides = config.get("max_slides", 0)
+        self.slides = 0
 
-        # This flag prevents the text from affecting the scene's bounding rectangle
-        self.clock_item.setFlag(QGraphicsTextItem.ItemIgnoresTransformations)
-        scene.addItem(self.clock_item)
-
-        self.info_item.setFlag(QGraphicsTextItem.ItemIgnoresTransformations)
-        scene.addItem(self.info_item)
-
-        self.text_item.setFlag(QGraphicsTextItem.ItemIgnoresTransformations)
-        scene.addItem(self.text_item)
-
+        # The image is centered on the scene origin and scales around it. With
+        # a fixed scene rect the view stays centered without centerOn().
+        scene.setSceneRect(QRectF(-1, -1, 2, 2))
         self.setScene(scene)
+        # only the area of the image (and of changed texts) is repainted
+        self.setViewportUpdateMode(QGraphicsView.BoundingRectViewportUpdate)
 
         self.setRenderHint(QPainter.SmoothPixmapTransform)
         # set view background color
@@ -77,11 +256,91 @@ class GrowingView(QGraphicsView):
 
         QTimer.singleShot(0, self.start_growing)  # start the timer after the view is shown
 
-
-
-
-    def set_new_image(self, filename):
-        image = QPixmap(filename)
+    def show_warm_frame(self):
+        """Shows the image of the snapshot, False if there is none"""
+        filename = self.saved.get("current")
+        frame = self.snapshot.frame(filename) if filename else None
+        if frame is None:
+            return False
+        pixmap = QPixmap(frame)
+        if pixmap.isNull():
+            return False
+        self.warm = filename
+        self.pixmaps.put(filename, pixmap, pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+        self.set_new_image(pixmap)
+        self.pixmap.setOpacity(1.0)
+        return True
+
+    def open_library(self):
+        """Scans the folder and continues the playlist of the snapshot"""
+        self.index = FolderIndex(self.save_dir)
+        # captions and view counts, written by the bot
+        self.catalog = Catalog(self.save_dir)
+        self.catalog.sync_all(path.basename(f) for f in self.index.files())
+        # the catalog may already list images the bot is still moving in
+        self.playlist = Playlist(f for f in (path.join(self.save_dir, name) for name in self.catalog.filenames())
+                                 if f in self.index)
+        if self.saved.get("playlist"):
+            self.playlist.restore(self.saved["playlist"], self.snapshot.load(Snapshot.ORDER))
+        if self.warm is not None and self.playlist.current() != self.warm:
+            # its image is gone
+            self.warm = None
+        # wakes us up when the bot sends commands, no polling needed
+        self.notifier = QSocketNotifier(self.channel.fileno(), QSocketNotifier.Read, self)
+        self.notifier.activated.connect(self.process_commands)
+
+    def save_snapshot(self, pixmap=None):
+        """Saves what is on screen for the next start, with the frames of the next images if decoded"""
+        if not self.warm_start:
+            return
+        filename = self.playlist.current()
+        state = {"current": filename, "message": self.info_text.text, "playlist": self.playlist.state()}
+        # the shuffled order is large, it is only written when a new round starts
+        order = self.playlist.order_state() if self.snapshot.order_changed(self.playlist.round) else None
+        if pixmap is None:
+            self.snapshot.save(state, order=order)
+            return
+        frames = {}
+        for name in [filename] + self.playlist.peek(self.warm_start - 1):
+            if self.snapshot.frame(name) is not None:
+                frames[name] = None
+            elif name == filename:
+                # QPixmap only lives in the GUI thread, the writer gets a QImage
+                frames[name] = self.frame_writer(pixmap.toImage())
+            elif name in self.ready and not self.ready[name][0].isNull():
+                # a copy, the decoded image may wrap the raw cache mapping
+                frames[name] = self.frame_writer(self.ready[name][0].copy())
+        self.snapshot.save(state, frames, order)
+
+    def frame_writer(self, image):
+        return lambda tmp: image.save(tmp)
+
+
+
+
+    def load(self, filename):
+        if filename not in self.ready and filename not in self.loading:
+            self.loading.add(filename)
+            self.pool.start(LoadJob(filename, self.viewport().size(), self.load_signals, self.metrics, self.raw_cache))
+
+    def prefetch(self):
+        """Starts decoding the next images and forgets the decoded ones no longer needed"""
+        wanted = set(self.playlist.peek(self.prefetch_depth))
+        wanted.add(self.upcoming)
+        for filename in list(self.ready):
+            if filename not in wanted:
+                del self.ready[filename]
+        for filename in self.playlist.peek(self.prefetch_depth):
+            if filename not in self.pixmaps:
+                self.load(filename)
+
+    def image_loaded(self, filename, image, pixels):
+        self.loading.discard(filename)
+        self.ready[filename] = (image, pixels)
+        if filename == self.upcoming and self.state == GrowingView.CHOOSE:
+            self.wake()
+
+    def set_new_image(self, image):
         self.pixmap.setPixmap(image)
         self.pixmap.setOpacity(0)
         self.pixmap.setOffset(-image.width() / 2, -image.height() / 2)
@@ -94,127 +353,293 @@ class GrowingView(QGraphicsView):
             self.scale_factor = vw / self.pixmap.pixmap().width()
         self.pixmap.setScale(self.scale_factor)
 
-        # Update text position after viewport is ready
-        self.update_text_position()
+    def target_scale(self):
+        """Scale at which the image covers the viewport height (landscape) or width (portrait)"""
+        pw = self.pixmap.pixmap().width()
+        ph = self.pixmap.pixmap().height()
+        if pw < ph:
+            target = self.viewport().width() / pw
+        else:
+            target = self.viewport().height() / ph
+        return max(self.scale_factor, target)
+
+    def grow_duration(self):
+        if self.grow_time is not None:
+            return self.grow_time
+        return (self.target_scale() - self.scale_factor) / self.grow_speed if self.grow_speed else 0
 
     def start_growing(self):
         # start after the view has been shown so viewport() has correct size
         if not self.timer.isActive():
-            self.state = GrowingView.CHOOSE
+            warm_shown = self.show_warm_frame()
+            if warm_shown:
+                # painted now, the folder is scanned after
+                self.viewport().repaint()
+                self.first_frame_shown = True
+                self.metrics.observe("first_frame", (time.perf_counter() - STARTED) * 1000)
+            self.open_library()
+            if self.warm is not None:
+                # already on screen, it just goes on growing
+                self.set_overlay_text(self.caption_text, self.caption(self.warm))
+                self.set_state(GrowingView.GROWING)
+                self.tween = Tween(self.scale_factor, self.target_scale(), self.grow_duration(), self.easing)
+            elif warm_shown:
+                # its image is gone, it fades out and CHOOSE takes another one
+                self.set_state(GrowingView.FADING)
+                self.tween = Tween(1.0, 0.0, self.fade_time, "ease_in_out")
+            else:
+                self.set_state(GrowingView.CHOOSE)
             self.timer.start()
 
-    def process_command(self, command):
-        if command.startswith("/m "):
-            message = command[3:]
-            self.info_item.setPlainText(message)
-        elif command == "/reset":
-            self.info_item.setPlainText("")
-        elif command == "/shuffle":
-            self.images = []
+    def process_commands(self):
+        for command in self.channel.drain():
+            self.process_command(command)
 
+    def process_command(self, command):
+        if isinstance(command, SetMessage):
+            self.set_overlay_text(self.info_text, command.text)
+            self.save_snapshot()
+        elif isinstance(command, ResetMessage):
+            self.set_overlay_text(self.info_text, "")
+            self.save_snapshot()
+        elif isinstance(command, Shuffle):
+            self.playlist.reshuffle()
+            self.prefetch()
+        elif isinstance(command, Next):
+            self.skip()
+        elif isinstance(command, Previous):
+            self.going_back = True
+            self.skip()
+        elif isinstance(command, NewImage):
+            # goes to the priority lane, shown right after the current one
+            self.playlist.add(command.path)
+            self.prefetch()
+            if self.waiting:
+                self.wake()
+
+
+    def caption(self, filename):
+        text = self.catalog.caption(path.basename(filename))
+        if self.show_remaining:
+            text += "\n" + str(len(self.playlist) - self.playlist.shown)
+        return text
+
+    def skip(self):
+        """Fades the current image out now, CHOOSE then takes the next (or previous) one"""
+        if self.playlist is None:
+            # the library is not open yet
+            return
+        if self.state in (GrowingView.BRIGHTENING, GrowingView.GROWING, GrowingView.SHOWING):
+            opacity = self.pixmap.opacity()
+            self.set_state(GrowingView.FADING)
+            self.tween = Tween(opacity, 0.0, self.fade_time * opacity, "ease_in_out")
+            self.wake()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Right:
+            self.skip()
+        elif event.key() == Qt.Key_Left:
+            self.going_back = True
+            self.skip()
+        else:
+            super().keyPressEvent(event)
+
+    def update_images(self):
+        # images copied by hand join the next round, deleted ones are skipped
+        added, removed = self.index.poll()
+        if added or removed:
+            self.catalog.sync([path.basename(f) for f in added], [path.basename(f) for f in removed])
+        for filename in added:
+            if filename not in self.playlist:
+                self.playlist.add(filename, priority=False)
+        for filename in removed:
+            self.playlist.remove(filename)
+
+    def set_state(self, state):
+        # while the image is not scaling it is painted from a cache, in which
+        # the fades only change the opacity it is blended with
+        if state == GrowingView.GROWING:
+            self.pixmap.setCacheMode(QGraphicsPixmapItem.NoCache)
+        else:
+            self.pixmap.setCacheMode(QGraphicsPixmapItem.DeviceCoordinateCache)
+        now = time.monotonic()
+        self.metrics.observe("state_" + GrowingView.STATE_NAMES[self.state], (now - self.state_ts) * 1000)
+        self.state_ts = now
+        self.state = state
 
     def grow(self):
-        self.update_clock()
+        start = time.perf_counter()
+        # a tick arriving much later than the timer interval is a dropped frame
+        if (self.tick_ts is not None and self.tick_interval is not None
+                and (start - self.tick_ts) * 1000 > 1.5 * self.tick_interval):
+            self.metrics.count("frames_dropped")
+        self.tick_ts = start
 
-        if self.queue.qsize() > 0:
-            command = self.queue.get()
-            self.process_command(command)
+        self.update_clock()
+        self.update_images()
 
         if self.state == GrowingView.CHOOSE:
-            if len(self.images) == 0:
-                self.images = glob.glob(self.save_dir + os.sep + "*.[jp][pn]g")
-                if len (self.images) == 0:
-                    time.sleep(1)
+            if len(self.playlist) == 0:
+                if not self.waiting:
                     print("No images found, waiting...")
-                shuffle(self.images)
+                self.waiting = True
+            elif self.max_slides and self.slides >= self.max_slides:
+                self.metrics.dump(force=True)
+                if self.raw_cache is not None:
+                    self.raw_cache.save(force=True)
+                self.snapshot.flush()
+                self.timer.stop()
+                QApplication.quit()
+                return
             else:
-                filename = self.images.pop(0)
-                self.set_new_image(filename)
-                if "unnamed" in filename or filename is None:
-                    text = ""
-                else:
-                    text = path.basename(filename).split("_")[0]
-                if self.show_remaining:
-                    text + "\n" + len(self.images).__str__()
-                self.text_item.setPlainText(text)
-                self.state = GrowingView.BRIGHTENING
+                self.waiting = False
+                if self.upcoming is None:
+                    self.upcoming = (self.playlist.prev() if self.going_back else None) or self.playlist.next()
+                    self.going_back = False
+                    self.transition_ts = time.perf_counter()
+                    if self.upcoming not in self.pixmaps:
+                        self.load(self.upcoming)
+                    self.prefetch()
+                filename = self.upcoming
+                if filename not in self.pixmaps and filename not in self.ready:
+                    # still decoding, image_loaded() wakes us up
+                    self.finish_tick(start)
+                    return
+                self.upcoming = None
+                pixmap = self.pixmaps.get(filename)
+                if pixmap is None:
+                    image, _ = self.ready.pop(filename)
+                    if image.isNull():
+                        # unreadable, pick another one next tick
+                        self.finish_tick(start)
+                        return
+                    with self.metrics.timer("upload"):
+                        pixmap = QPixmap.fromImage(image)
+                    self.pixmaps.put(filename, pixmap, pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+                self.metrics.gauge("pixmap_hit_rate", self.pixmaps.hit_rate())
+                self.slides += 1
+                self.set_new_image(pixmap)
+                if self.raw_cache is not None:
+                    self.raw_cache.save()
+                self.save_snapshot(pixmap)
+                if not self.first_frame_shown:
+                    self.first_frame_shown = True
+                    self.metrics.observe("first_frame", (time.perf_counter() - STARTED) * 1000)
+                # from picking the image to showing it, the decode wait included
+                self.metrics.observe("transition", (time.perf_counter() - self.transition_ts) * 1000)
+                self.catalog.record_view(path.basename(filename))
+                self.set_overlay_text(self.caption_text, self.caption(filename))
+                self.set_state(GrowingView.BRIGHTENING)
+                self.tween = Tween(0.0, 1.0, self.fade_time, "ease_in_out")
 
         elif self.state == GrowingView.BRIGHTENING:
-            if self.pixmap.opacity() >= 1.0 or self.fading_speed == 0:
-                self.state = GrowingView.GROWING
-            else:
-                self.pixmap.setOpacity(self.pixmap.opacity() + self.fading_speed)
+            self.pixmap.setOpacity(self.tween.value())
+            if self.tween.done():
+                self.set_state(GrowingView.GROWING)
+                self.tween = Tween(self.scale_factor, self.target_scale(), self.grow_duration(), self.easing)
+
         elif self.state == GrowingView.GROWING:
             self.pixmap.setOpacity(1.0)
-            next_scale = self.scale_factor + self.delta
-            self.pixmap.setScale(next_scale)
-            # get real size after scaling
-            w = self.pixmap.pixmap().width() * next_scale
-            h = self.pixmap.pixmap().height() * next_scale
-            vw = self.viewport().width()
-            vh = self.viewport().height()
-            self.centerOn(self.pixmap)
-            self.scale_factor = next_scale
-
-            if (w >= h >= vh) or (h >= w >= vw):
-                self.state = GrowingView.SHOWING
-                self.ts = time.time()
+            self.scale_factor = self.tween.value()
+            self.pixmap.setScale(self.scale_factor)
+            if self.tween.done():
+                self.set_state(GrowingView.SHOWING)
+                self.ts = time.monotonic()
 
         elif self.state == GrowingView.SHOWING:
-            if time.time() - self.ts > self.duration:
-                self.scale_factor = 0.1
-                self.state = GrowingView.FADING
-
-        elif self.state == GrowingView.FADING or self.fading_speed == 0:
-            if self.pixmap.opacity() <= 0:
-                self.state = GrowingView.CHOOSE
-            else:
-                self.pixmap: QGraphicsPixmapItem
-                self.pixmap.setOpacity(self.pixmap.opacity() - self.fading_speed)
-
-
-        # Keep text in upper left corner
-        self.update_text_position()
-
-    def update_text_position(self):
-        top_left = self.mapToScene(10, 10)
-        self.text_item.setPos(top_left)
-        top_right = self.mapToScene(self.viewport().width() - 150, 10)
-        self.clock_item.setPos(top_right)
-        bottom_left = self.mapToScene(10, self.viewport().height() - 60)
-        self.info_item.setPos(bottom_left)
+            if time.monotonic() - self.ts > self.duration:
+                self.set_state(GrowingView.FADING)
+                self.tween = Tween(1.0, 0.0, self.fade_time, "ease_in_out")
+
+        elif self.state == GrowingView.FADING:
+            self.pixmap: QGraphicsPixmapItem
+            self.pixmap.setOpacity(self.tween.value())
+            if self.tween.done():
+                self.set_state(GrowingView.CHOOSE)
+
+
+        self.finish_tick(start)
+
+    def wake(self):
+        """Ticks right away, that tick is not checked for being late"""
+        self.tick_interval = None
+        self.timer.start(0)
+
+    def finish_tick(self, start):
+        self.metrics.observe("frame", (time.perf_counter() - start) * 1000)
+        self.metrics.count("frames")
+        self.scheduler.frame()
+
+        # when to come back
+        if self.waiting:
+            state = "waiting"
+        elif self.upcoming is not None:
+            # image_loaded() restarts the timer
+            state = "loading"
+        else:
+            state = GrowingView.STATE_NAMES[self.state]
+        deadlines = [next_minute()]
+        if self.state == GrowingView.SHOWING:
+            deadlines.append(self.ts + self.duration)
+        elif self.waiting:
+            deadlines.append(time.monotonic() + self.index.interval)
+        self.tick_interval = self.scheduler.delay_ms(state, deadlines)
+        self.timer.setInterval(self.tick_interval)
+        self.metrics.gauge("fps", self.scheduler.rate())
+        self.metrics.gauge("frame_state", state)
+        self.metrics.dump()
+
+    def set_overlay_text(self, overlay, text):
+        old = overlay.rect(self.viewport().size())
+        if overlay.set_text(text):
+            self.viewport().update(old)
+            self.viewport().update(overlay.rect(self.viewport().size()))
+
+    def drawForeground(self, painter, rect):
+        # the texts are in viewport coordinates, not affected by the zoom
+        painter.save()
+        painter.resetTransform()
+        for overlay in self.overlays:
+            if overlay.pixmap is not None:
+                painter.drawPixmap(overlay.rect(self.viewport().size()).topLeft(), overlay.pixmap)
+        painter.restore()
 
     def update_clock(self):
-        current_time = time.strftime("%H:%M")
-        self.clock_item.setPlainText(current_time)
-
-    def resizeEvent(self, event):
-        super().resizeEvent(event)
-        self.update_text_position()
+        self.set_overlay_text(self.clock_text, time.strftime("%H:%M"))
 
 
 if __name__ == "__main__":
     base_dir = os.path.expanduser('~/.config/thegoodone')
     os.makedirs(base_dir, exist_ok=True)
 
-    q = multiprocessing.Queue()
+    channel = CommandChannel()
 
     # load config
     try:
         with open(base_dir + os.sep + "config.yaml", "r") as f:
             config = yaml.safe_load(f)
     except Exception as e:
-        config = {"bot_token": None, "rate": 30, "duration": 1, "scale_delta": 0.01, "font_size": 32, "fading_speed": 0.02, "save_dir": "downloads", "authorized_users": []}
+        config = {"bot_token": None, "rate": 30, "duration": 1, "scale_delta": 0.01, "font_size": 32, "fading_speed": 0.02, "easing": "ease_out", "save_dir": "downloads", "authorized_users": []}
         yaml.safe_dump(config, open(base_dir + os.sep + "config.yaml", "w"))
 
-    if config.get("bot_token", None) is not None:
-        bot_process = multiprocessing.Process(target=run_bot, args=(q,config,))
+    # written by the view, read by the bot for /stats
+    config.setdefault("stats_file", base_dir + os.sep + "stats.json")
+
+    if config.get("sync_server", None) is not None:
+        print(f"Showing the images of {config['sync_server']}, NOT starting bot.")
+    elif config.get("bot_token", None) is not None:
+        bot_process = multiprocessing.Process(target=start_bot, args=(channel,config,))
         bot_process.start()
     else:
         print("Please set bot_token in config.yaml")
 
     app = QApplication(sys.argv)
-    view = GrowingView(q, config)
+    if config.get("sync_server", None) is not None:
+        # mirror the images of the bot's screen, resized for this one
+        screen = app.primaryScreen().size()
+        SyncClient(config["sync_server"], config.get("save_dir", "downloads"), (screen.width(), screen.height()),
+                   channel, config.get("sync_group", None), config.get("sync_token", None)).start()
+    view = GrowingView(channel, config)
     view.setAlignment(Qt.AlignCenter)
     view.showFullScreen()
 